@@ -78,8 +78,8 @@ async def websocket_endpoint(websocket: WebSocket):
     await ws_manager.connect(websocket)
     try:
         while True:
-            # Keep connection open; ignore incoming messages for now
-            await websocket.receive_text()
+            # Clients may send subscription messages, see WebSocketManager
+            ws_manager.handle_message(websocket, await websocket.receive_text())
     except Exception:
         ws_manager.disconnect(websocket)
 
@@ -88,33 +88,86 @@ async def websocket_endpoint(websocket: WebSocket):
 from .services.logging_service import LoggingService
 logging_service = LoggingService()
 
+
+@app.on_event("startup")
+async def start_logging():
+    await logging_service.start()
+
+
+@app.on_event("shutdown")
+async def stop_logging():
+    await logging_service.close()
+
 # ... existing code ...
 
+# Latest admission control counters reported by the bot
+admission_stats = {}
+
+
+@app.get("/api/admission/stats")
+async def get_admission_stats():
+    """Generation queue depth, active slots and rejection counters from the bot"""
+    return admission_stats
+
+
+# Latest /chat response cache counters reported by the bot
+chat_cache_stats = {}
+
+
+@app.get("/api/chat/cache")
+async def get_chat_cache_stats():
+    """Exact hits, near-duplicate hits and misses of the /chat response cache"""
+    return chat_cache_stats
+
+
+# Latest image latency and hedging counters reported by the bot
+image_stats = {}
+
+
 @app.post("/events")
 async def post_event(request: Request):
-    """Receive events (from the bot process) and broadcast to connected websocket clients."""
+    """Receive events (from the bot process) and broadcast to connected websocket clients.
+
+    Accepts a single event object, a JSON array of events, or NDJSON
+    (`Content-Type: application/x-ndjson`) with one event per line.
+    """
+    body = await request.body()
     try:
-        payload = await request.json()
+        if "ndjson" in request.headers.get("content-type", ""):
+            events = [json.loads(line) for line in body.splitlines() if line.strip()]
+        else:
+            payload = json.loads(body)
+            events = payload if isinstance(payload, list) else [payload]
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid JSON payload")
 
-    # Persist log
-    try:
-        await logging_service.log_event(
-            type=payload.get("type", "system"),
-            message=f"Event: {payload.get('type')}",
-            details=payload.get("payload")
-        )
-    except Exception:
-        pass
+    for payload in events:
+        if not isinstance(payload, dict):
+            raise HTTPException(status_code=400, detail="Each event must be a JSON object")
 
-    try:
-        text = json.dumps(payload)
-        await ws_manager.broadcast(text)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to broadcast event: {e}")
+        # Persist log
+        try:
+            await logging_service.log_event(
+                type=payload.get("type", "system"),
+                message=f"Event: {payload.get('type')}",
+                details=payload.get("payload")
+            )
+        except Exception:
+            pass
+
+        if payload.get("type") == "admission_stats":
+            admission_stats.update(payload.get("payload") or {})
+        elif payload.get("type") == "chat_cache":
+            chat_cache_stats.update({k: v for k, v in (payload.get("payload") or {}).items() if k != "result"})
+        elif payload.get("type") == "image_stats":
+            image_stats.update(payload.get("payload") or {})
+
+        try:
+            await ws_manager.broadcast(payload)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to broadcast event: {e}")
 
-    return {"status": "ok"}
+    return {"status": "ok", "received": len(events)}
 
 
 
@@ -168,9 +221,38 @@ async def interactions_endpoint(request: Request):
 
 
 @app.get("/api/logs")
-async def get_logs_api(limit: int = 50, level: str = "ALL"):
-    """Get system logs"""
-    return {"logs": await logging_service.get_logs(limit, level)}
+async def get_logs_api(
+    limit: int = 50,
+    level: str = "ALL",
+    type: str = "ALL",
+    since: float = None,
+    until: float = None,
+    before: str = None,
+    fields: str = None,
+    count: bool = False
+):
+    """Get system logs, newest first. Pass `next_cursor` back as `before` for the next page."""
+    if limit < 1 or limit > 500:
+        raise HTTPException(status_code=400, detail="Limit must be between 1 and 500")
+    try:
+        return await logging_service.get_logs(
+            limit=limit,
+            level=level,
+            type=type,
+            since=since,
+            until=until,
+            before=before,
+            fields=[f.strip() for f in fields.split(",") if f.strip()] if fields else None,
+            with_count=count
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/api/logs/stats")
+async def get_log_stats():
+    """Get log writer counters (queued, written, dropped, failed)"""
+    return logging_service.get_stats()
 
 
 # Image Generation API endpoints
@@ -178,20 +260,33 @@ async def get_logs_api(limit: int = 50, level: str = "ALL"):
 
 
 # Image Generation API endpoints
-from .services.image_service import ImageService
+from .services.image_service import image_service
+from .services.image_cache import ImageCache, KEY_PATTERN
 from .config import config
 
-image_service = ImageService(
-    default_model=config.IMAGE_MODEL,
-    auth_token=config.POLLINATIONS_TOKEN
-)
+@app.on_event("shutdown")
+async def close_image_client():
+    await image_service.close()
 
 @app.get("/api/image/models")
 async def get_image_models():
-    """Get available image generation models and current model"""
+    """
+    Get available image generation models, current model and rolling per-model latency.
+
+    Latency comes from the bot, where /imagine and mentions generate images; until
+    it has reported, the API's own (dashboard) generations are shown instead.
+    """
+    stats = image_stats or image_service.get_hedging_stats()
     return {
         "models": image_service.AVAILABLE_MODELS,
-        "current_model": image_service.get_current_model()
+        "current_model": image_service.get_current_model(),
+        "stats": stats["models"],
+        "hedging": {
+            "enabled": config.IMAGE_HEDGING,
+            "slo_seconds": config.IMAGE_SLO_SECONDS,
+            "hedged": stats["hedged"],
+            "hedge_wins": stats["hedge_wins"]
+        }
     }
 
 @app.post("/api/image/model")
@@ -201,6 +296,23 @@ async def set_image_model(model: str):
         return {"success": True, "model": model}
     raise HTTPException(status_code=400, detail=f"Invalid model. Choose from: {image_service.AVAILABLE_MODELS}")
 
+@app.get("/api/image/cache/{key}")
+async def get_cached_image(key: str):
+    """Serve a cached image; the file is streamed from disk, not loaded into memory"""
+    path = image_service.cache.path(key) if KEY_PATTERN.match(key) else None
+    if path is None:
+        raise HTTPException(status_code=404, detail="Image not cached")
+    return FileResponse(
+        path,
+        media_type=ImageCache.media_type(path),
+        headers={"Cache-Control": "public, max-age=31536000, immutable"}
+    )
+
+@app.get("/api/image/cache")
+async def get_image_cache_stats():
+    """Disk cache usage and hit rate, plus upstream downloads saved by merging identical requests"""
+    return {**image_service.cache.get_stats(), **image_service.stats}
+
 @app.post("/api/image/generate")
 async def generate_image_api(request: Request):
     """Generate an image from a prompt"""
@@ -227,7 +339,7 @@ async def generate_image_api(request: Request):
             enhance=enhance
         )
         
-        return {
+        result = {
             "success": True,
             "image_url": image_url,
             "prompt": prompt,
@@ -235,13 +347,35 @@ async def generate_image_api(request: Request):
             "width": width,
             "height": height
         }
+
+        if data.get("prefetch", config.IMAGE_PREFETCH):
+            # Warm the cache so the dashboard can load the image from us
+            try:
+                _, key = await image_service.fetch_image(prompt, model, width, height, enhance=enhance)
+                result["cache_url"] = f"/api/image/cache/{key}"
+            except Exception as e:
+                print(f"Image prefetch failed: {e}")
+        return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # Behavior / System Instruction API
 from .services.behavior_service import BehaviorService
+from .services.behavior_sync import BehaviorSync
 behavior_service = BehaviorService()
+behavior_sync = BehaviorSync(behavior_service)
+
+
+@app.on_event("startup")
+async def start_behavior_sync():
+    await behavior_sync.start()
+
+
+@app.on_event("shutdown")
+async def flush_behaviors():
+    await behavior_sync.close()
+    await behavior_service.flush()
 
 
 
@@ -292,6 +426,13 @@ async def set_default_persona(request: Request):
     behavior_service.set_default_persona(data["personaId"])
     return {"success": True}
 
+@app.post("/api/behaviors/role-priority")
+async def set_role_priority(request: Request):
+    """Set which assigned role wins when a user has several (first wins)"""
+    data = await request.json()
+    behavior_service.set_role_priority(data["roles"])
+    return {"success": True}
+
 @app.post("/api/behaviors/guidelines")
 async def set_guidelines(request: Request):
     """Set global guidelines appended to all prompts"""
@@ -323,4 +464,4 @@ if os.path.exists(static_dir):
 
 
 if __name__ == "__main__":
-    run(app, host="0.0.0.0", port=8000)
+    run(app, host="0.0.0.0", port=8000, ws_per_message_deflate=True)
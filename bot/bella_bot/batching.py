@@ -0,0 +1,58 @@
+import asyncio
+
+_NOTHING = object()
+
+
+async def _get(queue: asyncio.Queue, timeout: float | None, stop: asyncio.Event | None):
+    """queue.get() that gives up after `timeout` seconds or once `stop` is set, returning _NOTHING"""
+    getter = asyncio.ensure_future(queue.get())
+    waiters = {getter}
+    if stop is not None:
+        waiters.add(asyncio.ensure_future(stop.wait()))
+    try:
+        await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        # A getter that hasn't run yet takes nothing from the queue when cancelled
+        for waiter in waiters:
+            waiter.cancel()
+    if getter.done() and not getter.cancelled():
+        return getter.result()
+    return _NOTHING
+
+
+async def next_batch(queue: asyncio.Queue, max_size: int, max_wait: float, stop: asyncio.Event = None) -> list:
+    """
+    Wait for at least one item, then collect more until `max_size` items or
+    `max_wait` seconds after the first one, whichever comes first.
+
+    Once `stop` is set it returns what it has (possibly nothing) as soon as the
+    queue runs dry, so owners can stop their loop without cancelling it and
+    losing a batch already taken off the queue.
+    """
+    loop = asyncio.get_running_loop()
+    batch = []
+    deadline = None
+    while len(batch) < max_size:
+        try:
+            batch.append(queue.get_nowait())
+        except asyncio.QueueEmpty:
+            if stop is not None and stop.is_set():
+                break
+            remaining = None if deadline is None else deadline - loop.time()
+            if remaining is not None and remaining <= 0:
+                break
+            item = await _get(queue, remaining, stop)
+            if item is _NOTHING:
+                break
+            batch.append(item)
+        if deadline is None:
+            deadline = loop.time() + max_wait
+    return batch
+
+
+def drain(queue: asyncio.Queue) -> list:
+    """Take everything currently in the queue without waiting"""
+    items = []
+    while not queue.empty():
+        items.append(queue.get_nowait())
+    return items
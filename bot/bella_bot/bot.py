@@ -7,8 +7,22 @@ intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True
 
+class BellaBot(commands.Bot):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Coroutine functions awaited on shutdown, e.g. to flush buffered writes
+        self.shutdown_hooks = []
+
+    async def close(self):
+        for hook in self.shutdown_hooks:
+            try:
+                await hook()
+            except Exception as e:
+                print(f'Error in shutdown hook: {e}')
+        await super().close()
+
 # Create bot instance
-bot = commands.Bot(command_prefix='!', intents=intents)
+bot = BellaBot(command_prefix='!', intents=intents)
 
 @bot.event
 async def on_ready():
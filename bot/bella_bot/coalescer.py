@@ -0,0 +1,127 @@
+import asyncio
+from typing import Awaitable, Callable, Hashable
+
+
+class _Batch:
+    __slots__ = ("key", "handler", "ids", "items", "task", "committed")
+
+    def __init__(self, key: Hashable, handler):
+        self.key = key
+        self.handler = handler
+        self.ids = []
+        self.items = []
+        self.task = None
+        self.committed = False
+
+
+class MessageCoalescer:
+    """
+    Debounces bursts per key (e.g. (channel, user)) into one handler call.
+
+    Every submit restarts a `window` second timer; when it fires the handler
+    gets all items of the batch plus a `commit` callback. Until the handler
+    calls commit (right before it posts anything) a new item cancels the run and
+    starts over with the merged batch. After commit the run is left alone and
+    new items open a fresh batch.
+
+    Items submitted with an id (e.g. the message id) stay tracked until their
+    run finishes, so withdraw() and replace() can cancel or redo it when the
+    source message is deleted or edited.
+    """
+
+    def __init__(self, window: float):
+        self.window = window
+        self._batches: dict[Hashable, _Batch] = {}
+        self._by_id: dict[Hashable, _Batch] = {}
+        self.stats = {"batches": 0, "merged": 0, "cancelled": 0, "withdrawn": 0, "replaced": 0}
+
+    def is_open(self, key: Hashable) -> bool:
+        """True while a batch for key can still take more items"""
+        batch = self._batches.get(key)
+        return batch is not None and not batch.committed
+
+    def submit(self, key: Hashable, item, handler: Callable[[list, Callable[[], None]], Awaitable], item_id: Hashable = None):
+        batch = self._batches.get(key)
+        if batch is None or batch.committed:
+            batch = self._batches[key] = _Batch(key, handler)
+            self.stats["batches"] += 1
+        else:
+            self.stats["merged"] += 1
+
+        batch.ids.append(item_id)
+        batch.items.append(item)
+        if item_id is not None:
+            self._by_id[item_id] = batch
+        self._schedule(batch)
+
+    def get(self, item_id: Hashable):
+        """The tracked item with this id, or None once its run has finished"""
+        batch = self._by_id.get(item_id)
+        return batch.items[batch.ids.index(item_id)] if batch is not None else None
+
+    def withdraw(self, item_id: Hashable) -> bool:
+        """Drop an item; its run is cancelled, and redone without it if the batch still has items"""
+        batch = self._by_id.pop(item_id, None)
+        if batch is None:
+            return False
+        index = batch.ids.index(item_id)
+        del batch.ids[index], batch.items[index]
+        self.stats["withdrawn"] += 1
+
+        if not batch.items:
+            batch.task.cancel()
+            self._discard(batch)
+        elif not batch.committed:
+            self._schedule(batch)
+        return True
+
+    def replace(self, item_id: Hashable, item) -> bool:
+        """Swap in an updated item and redo the run, even if it had already started posting"""
+        batch = self._by_id.get(item_id)
+        if batch is None:
+            return False
+        batch.items[batch.ids.index(item_id)] = item
+        self.stats["replaced"] += 1
+        if batch.committed:
+            batch.committed = False
+            if self._batches.get(batch.key) is None:
+                self._batches[batch.key] = batch
+        self._schedule(batch)
+        return True
+
+    def _schedule(self, batch: _Batch):
+        if batch.task is not None and not batch.task.done():
+            batch.task.cancel()
+            self.stats["cancelled"] += 1
+        batch.task = asyncio.get_running_loop().create_task(self._run(batch))
+
+    async def _run(self, batch: _Batch):
+        await asyncio.sleep(self.window)
+
+        def commit():
+            batch.committed = True
+
+        try:
+            await batch.handler(list(batch.items), commit)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error handling coalesced batch: {e}")
+        finally:
+            if batch.task is asyncio.current_task():
+                self._discard(batch)
+
+    def _discard(self, batch: _Batch):
+        if self._batches.get(batch.key) is batch:
+            del self._batches[batch.key]
+        for item_id in batch.ids:
+            if self._by_id.get(item_id) is batch:
+                del self._by_id[item_id]
+
+    async def close(self):
+        tasks = [batch.task for batch in set(self._by_id.values()) | set(self._batches.values()) if batch.task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._batches.clear()
+        self._by_id.clear()
@@ -1,26 +1,77 @@
 import discord
 from discord import app_commands
-from ..services.ai_service import AIService
+from ..services.ai_service import ai_service, is_failure
+from ..services.reply_streamer import StreamedReply, EMPTY_RESPONSE
+from ..services.response_cache import ResponseCache
+from ..services.event_publisher import event_publisher
+from ..services.admission_service import admission_service, Rejected, PRIORITY_OWNER, PRIORITY_MENTION
+from ..services.offload_service import offload_service
+from ..config import config
+
+response_cache = ResponseCache()
+
+# /chat sends no user context or system instruction, so every caller gets the same persona
+PERSONA = "default"
+
+
+async def send_chunks(interaction: discord.Interaction, response: str):
+    # Discord has a 2000 character limit per message
+    for i in range(0, len(response), 2000):
+        await interaction.followup.send(response[i:i+2000])
 
-ai_service = AIService()
 
 async def setup(bot):
+    if event_publisher.close not in bot.shutdown_hooks:
+        bot.shutdown_hooks.append(event_publisher.close)
+
     @bot.tree.command(name="chat", description="Chat with Bella (AI assistant)")
     async def chat(interaction: discord.Interaction, message: str):
         """Chat command that uses Gemini to generate responses"""
         await interaction.response.defer(thinking=True)
-        
+
+        # Repeated questions are answered from the cache without a generation slot
+        cached, result = response_cache.get(PERSONA, ai_service.model, message)
+        event_publisher.publish({'type': 'chat_cache', 'payload': {'result': result, **response_cache.get_stats()}})
+        if cached is not None:
+            await send_chunks(interaction, cached)
+            return
+
+        priority = PRIORITY_OWNER if await interaction.client.is_owner(interaction.user) else PRIORITY_MENTION
         try:
-            response = await ai_service.generate_response(message)
-            
-            # Discord has a 2000 character limit per message
-            if len(response) > 2000:
-                # Split into chunks
-                chunks = [response[i:i+2000] for i in range(0, len(response), 2000)]
-                await interaction.followup.send(chunks[0])
-                for chunk in chunks[1:]:
-                    await interaction.followup.send(chunk)
+            await admission_service.acquire(
+                str(interaction.user.id),
+                str(interaction.guild_id) if interaction.guild_id else None,
+                priority
+            )
+        except Rejected as e:
+            await interaction.followup.send(f"⏳ Slow down a little! Try again in {max(1, round(e.retry_after))}s.")
+            return
+
+        try:
+            # Worker results arrive whole, so offloaded replies aren't streamed
+            if config.STREAM_REPLIES and offload_service is None:
+                # wait=True returns the followup message so it can be edited while streaming
+                async def send(content: str):
+                    return await interaction.followup.send(content, wait=True)
+
+                failed = False
+
+                async def watched(stream):
+                    nonlocal failed
+                    async for chunk in stream:
+                        # Error stand-ins always come as the last chunk
+                        failed = is_failure(chunk)
+                        yield chunk
+
+                response, _ = await StreamedReply(send).run(watched(ai_service.generate_response_stream(message)))
             else:
-                await interaction.followup.send(response)
+                response, _ = await (offload_service or ai_service).generate_response(message)
+                failed = is_failure(response)
+                await send_chunks(interaction, response)
+
+            if not failed and response != EMPTY_RESPONSE:
+                response_cache.set(PERSONA, ai_service.model, message, response)
         except Exception as e:
-            await interaction.followup.send(f"Sorry, I encountered an error: {str(e)}")
\ No newline at end of file
+            await interaction.followup.send(f"Sorry, I encountered an error: {str(e)}")
+        finally:
+            admission_service.release()
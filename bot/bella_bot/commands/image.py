@@ -1,25 +1,75 @@
+import asyncio
+import random
 import discord
 from discord import app_commands
 from discord.ext import commands
 from io import BytesIO
-from ..services.image_service import ImageService
-from ..config import config
+from .. import image_grid
+from ..image_reply import fetch_image, image_message
+from ..services.image_service import image_service
+
+
+class VariationButton(discord.ui.Button):
+    def __init__(self, index: int, upscale: bool):
+        super().__init__(
+            label=f"{'U' if upscale else 'V'}{index + 1}",
+            style=discord.ButtonStyle.primary if upscale else discord.ButtonStyle.secondary,
+            row=1 if upscale else 0
+        )
+        self.index = index
+        self.upscale = upscale
+
+    async def callback(self, interaction: discord.Interaction):
+        await self.view.send_variation(interaction, self.index, self.upscale)
+
+
+class VariationView(discord.ui.View):
+    """V buttons post one variation full size, U buttons regenerate it at double resolution"""
+
+    def __init__(self, guild_id, request: dict, seeds: list[int]):
+        super().__init__(timeout=900)
+        self.guild_id = guild_id
+        self.request = request
+        self.seeds = seeds
+        for upscale in (False, True):
+            for index in range(len(seeds)):
+                self.add_item(VariationButton(index, upscale))
+
+    async def send_variation(self, interaction: discord.Interaction, index: int, upscale: bool):
+        await interaction.response.defer()
+        request = dict(self.request, seed=self.seeds[index])
+        if upscale:
+            request["width"] = min(request["width"] * 2, 2048)
+            request["height"] = min(request["height"] * 2, 2048)
+
+        embed = discord.Embed(
+            title=f"🎨 {'Upscaled ' if upscale else ''}Variation {index + 1}",
+            description=f"**Prompt:** {request['prompt']}",
+            color=discord.Color.purple()
+        )
+        embed.add_field(name="Size", value=f"{request['width']}x{request['height']}", inline=True)
+        embed.add_field(name="Seed", value=str(request["seed"]), inline=True)
+        embed.set_footer(text=f"Requested by {interaction.user.name}")
+        try:
+            send_kwargs = await image_message(self.guild_id, embed, **request)
+            await interaction.followup.send(**send_kwargs)
+        except Exception as e:
+            await interaction.followup.send(f"❌ Error generating image: {str(e)}")
+
 
 class ImageCommands(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.image_service = ImageService(
-            default_model=config.IMAGE_MODEL,
-            auth_token=config.POLLINATIONS_TOKEN
-        )
-    
+        self.image_service = image_service
+
     @app_commands.command(name="imagine", description="Generate an image from text")
     @app_commands.describe(
         prompt="Describe the image you want to generate",
         model="AI model to use (flux, turbo, stable-diffusion)",
         width="Image width (default 1024)",
         height="Image height (default 1024)",
-        enhance="Auto-enhance your prompt"
+        enhance="Auto-enhance your prompt",
+        count="Number of variations to generate (1-4)"
     )
     @app_commands.choices(model=[
         app_commands.Choice(name="Flux (High Quality)", value="flux"),
@@ -33,7 +83,8 @@ class ImageCommands(commands.Cog):
         model: str = None,
         width: int = 1024,
         height: int = 1024,
-        enhance: bool = False
+        enhance: bool = False,
+        count: app_commands.Range[int, 1, 4] = 1
     ):
         """Generate an image using AI"""
         await interaction.response.defer()
@@ -47,35 +98,61 @@ class ImageCommands(commands.Cog):
                 await interaction.followup.send("Height must be between 256 and 2048 pixels!")
                 return
             
-            # Generate image
-            image_url = await self.image_service.generate_image(
-                prompt=prompt,
-                model=model,
-                width=width,
-                height=height,
-                enhance=enhance
-            )
-            
             # Get the model name
             used_model = model if model else self.image_service.get_current_model()
             
             # Create embed
             embed = discord.Embed(
-                title="🎨 Image Generated!",
+                title="🎨 Image Generated!" if count == 1 else f"🎨 {count} Variations Generated!",
                 description=f"**Prompt:** {prompt}",
                 color=discord.Color.purple()
             )
             embed.add_field(name="Model", value=used_model.title(), inline=True)
             embed.add_field(name="Size", value=f"{width}x{height}", inline=True)
             embed.add_field(name="Enhanced", value="Yes" if enhance else "No", inline=True)
-            embed.set_image(url=image_url)
             embed.set_footer(text=f"Generated by {interaction.user.name}")
+
+            request = {"prompt": prompt, "model": used_model, "width": width, "height": height, "enhance": enhance}
+            if count == 1:
+                send_kwargs = await image_message(interaction.guild_id, embed, **request)
+            else:
+                send_kwargs = await self._variations_message(interaction.guild_id, embed, request, count)
             
-            await interaction.followup.send(embed=embed)
+            await interaction.followup.send(**send_kwargs)
             
         except Exception as e:
             await interaction.followup.send(f"❌ Error generating image: {str(e)}")
-    
+
+    async def _variations_message(self, guild_id, embed: discord.Embed, request: dict, count: int) -> dict:
+        """Fetch variations concurrently with distinct seeds and show them as one grid"""
+        base_seed = random.randrange(2**31 - count)
+        seeds = [base_seed + i for i in range(count)]
+        results = await asyncio.gather(
+            *(fetch_image(guild_id, seed=seed, **request) for seed in seeds),
+            return_exceptions=True
+        )
+
+        variations = [(seed, result) for seed, result in zip(seeds, results) if not isinstance(result, BaseException)]
+        if not variations:
+            raise results[0]
+        seeds = [seed for seed, _ in variations]
+        images = [data for _, (data, _) in variations]
+        if len(variations) < count:
+            embed.add_field(name="Note", value=f"{count - len(variations)} variation(s) failed", inline=False)
+
+        view = VariationView(guild_id, request, seeds)
+        if image_grid.available():
+            grid = await asyncio.to_thread(image_grid.compose_grid, images)
+            embed.set_image(url="attachment://variations.jpg")
+            return {"embed": embed, "file": discord.File(BytesIO(grid), filename="variations.jpg"), "view": view}
+
+        # Without Pillow, attach the variations side by side instead of a composed grid
+        files = [
+            discord.File(BytesIO(data), filename=f"{i + 1}_{self.image_service.attachment_name(key, data)}")
+            for i, (_, (data, key)) in enumerate(variations)
+        ]
+        return {"embed": embed, "files": files, "view": view}
+
     @app_commands.command(name="imagemodel", description="Set the default image generation model")
     @app_commands.describe(model="Choose the default AI model")
     @app_commands.choices(model=[
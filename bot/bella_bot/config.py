@@ -12,6 +12,7 @@ class Config:
     DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
     GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
     POLLINATIONS_TOKEN = os.getenv("POLLINATIONS_TOKEN")
+    IMAGE_MODEL = os.getenv("IMAGE_MODEL", "flux")
     MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
     
     # Lavalink / Music
@@ -20,4 +21,108 @@ class Config:
     LAVALINK_PASSWORD = os.getenv("LAVALINK_PASSWORD", "youshallnotpass")
     LAVALINK_SECURE = os.getenv("LAVALINK_SECURE", "false").lower() == "true"
 
+    # AI / Gemini
+    AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", 8))
+    AI_REQUEST_TIMEOUT = float(os.getenv("AI_REQUEST_TIMEOUT", 60))
+    STREAM_REPLIES = os.getenv("STREAM_REPLIES", "true").lower() == "true"
+    # Discord allows roughly 5 message edits per 5 seconds per channel
+    STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", 1.2))
+    # Messages from one user in one channel within this many seconds get a single reply
+    COALESCE_WINDOW = float(os.getenv("COALESCE_WINDOW", 1.0))
+    # /chat answers for repeated prompts. Optionally, prompts whose word pairs are at least
+    # this similar to a cached one also hit, e.g. 0.6 (0 = exact matches only)
+    CHAT_CACHE_SIZE = int(os.getenv("CHAT_CACHE_SIZE", 2000))
+    CHAT_CACHE_TTL = float(os.getenv("CHAT_CACHE_TTL", 3600))
+    CHAT_CACHE_SIMILARITY = float(os.getenv("CHAT_CACHE_SIMILARITY", 0))
+
+    # Admission control for generations: token buckets (requests/second and burst size)
+    # per user, per guild and globally, then a bounded priority queue for free slots
+    ADMISSION_USER_RATE = float(os.getenv("ADMISSION_USER_RATE", 0.2))
+    ADMISSION_USER_BURST = float(os.getenv("ADMISSION_USER_BURST", 3))
+    ADMISSION_GUILD_RATE = float(os.getenv("ADMISSION_GUILD_RATE", 1))
+    ADMISSION_GUILD_BURST = float(os.getenv("ADMISSION_GUILD_BURST", 10))
+    ADMISSION_GLOBAL_RATE = float(os.getenv("ADMISSION_GLOBAL_RATE", 5))
+    ADMISSION_GLOBAL_BURST = float(os.getenv("ADMISSION_GLOBAL_BURST", 20))
+    ADMISSION_MAX_ACTIVE = int(os.getenv("ADMISSION_MAX_ACTIVE", AI_MAX_CONCURRENCY))
+    ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", 50))
+    ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", 30))
+    ADMISSION_STATS_INTERVAL = float(os.getenv("ADMISSION_STATS_INTERVAL", 5))
+    # A user is told to slow down at most once per this many seconds
+    ADMISSION_NOTICE_INTERVAL = float(os.getenv("ADMISSION_NOTICE_INTERVAL", 30))
+
+    # Memory
+    MEMORY_CACHE_SIZE = int(os.getenv("MEMORY_CACHE_SIZE", 1000))
+    MEMORY_CACHE_TTL = float(os.getenv("MEMORY_CACHE_TTL", 600))
+    # Interaction updates are buffered and written in bulk on whichever comes first
+    MEMORY_FLUSH_INTERVAL = float(os.getenv("MEMORY_FLUSH_INTERVAL", 30))
+    MEMORY_FLUSH_SIZE = int(os.getenv("MEMORY_FLUSH_SIZE", 200))
+    FACT_MAX_PER_USER = int(os.getenv("FACT_MAX_PER_USER", 200))
+    FACT_DUPLICATE_THRESHOLD = float(os.getenv("FACT_DUPLICATE_THRESHOLD", 0.8))
+    FACT_TOP_K = int(os.getenv("FACT_TOP_K", 8))
+    FACT_TOKEN_BUDGET = int(os.getenv("FACT_TOKEN_BUDGET", 250))
+    # Background compaction of facts into conversation_summary
+    COMPACTION_FACT_THRESHOLD = int(os.getenv("COMPACTION_FACT_THRESHOLD", 40))
+    COMPACTION_TOKEN_THRESHOLD = int(os.getenv("COMPACTION_TOKEN_THRESHOLD", 1500))
+    COMPACTION_BATCH_SIZE = int(os.getenv("COMPACTION_BATCH_SIZE", 5))
+    COMPACTION_MIN_INTERVAL = float(os.getenv("COMPACTION_MIN_INTERVAL", 4))
+    COMPACTION_SUMMARY_TOKENS = int(os.getenv("COMPACTION_SUMMARY_TOKENS", 200))
+    # Rolling per-channel conversation history
+    CONVERSATION_MAX_TURNS = int(os.getenv("CONVERSATION_MAX_TURNS", 20))
+    CONVERSATION_TOKEN_BUDGET = int(os.getenv("CONVERSATION_TOKEN_BUDGET", 800))
+    CONVERSATION_GLOBAL_TOKENS = int(os.getenv("CONVERSATION_GLOBAL_TOKENS", 200000))
+
+    # Logging
+    LOG_TTL_DAYS = int(os.getenv("LOG_TTL_DAYS", 7))
+    LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", 100))
+    LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", 2))
+    LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+    # How long log_event waits for queue space before dropping the entry
+    LOG_ENQUEUE_TIMEOUT = float(os.getenv("LOG_ENQUEUE_TIMEOUT", 0.05))
+
+    # Dashboard events sent from the bot to the API's /events endpoint
+    EVENTS_URL = (os.getenv("BOT_PUBLIC_URL") or os.getenv("VITE_API_BASE_URL") or "http://localhost:8000").rstrip("/") + "/events"
+    EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", 1000))
+    EVENT_BATCH_SIZE = int(os.getenv("EVENT_BATCH_SIZE", 50))
+    EVENT_FLUSH_INTERVAL = float(os.getenv("EVENT_FLUSH_INTERVAL", 0.5))
+
+    # Dashboard WebSocket fan-out
+    WS_QUEUE_SIZE = int(os.getenv("WS_QUEUE_SIZE", 100))
+    WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", 5))
+    # A client that loses this many events to drop-oldest without catching up in between is disconnected
+    WS_MAX_DROPS = int(os.getenv("WS_MAX_DROPS", 500))
+
+    # Behaviors: mutations within this window are written to disk together
+    BEHAVIOR_SAVE_DELAY = float(os.getenv("BEHAVIOR_SAVE_DELAY", 0.5))
+    BEHAVIOR_CACHE_SIZE = int(os.getenv("BEHAVIOR_CACHE_SIZE", 2048))
+    # Share behaviors between the bot and API processes through MongoDB
+    BEHAVIOR_SYNC = os.getenv("BEHAVIOR_SYNC", "true").lower() == "true"
+    BEHAVIOR_POLL_INTERVAL = float(os.getenv("BEHAVIOR_POLL_INTERVAL", 2))
+    BEHAVIOR_OPS_TTL_DAYS = int(os.getenv("BEHAVIOR_OPS_TTL_DAYS", 7))
+
+    # Generated images, cached on disk by request
+    IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "image_cache")
+    IMAGE_CACHE_MAX_MB = int(os.getenv("IMAGE_CACHE_MAX_MB", 512))
+    IMAGE_HTTP_MAX_CONNECTIONS = int(os.getenv("IMAGE_HTTP_MAX_CONNECTIONS", 20))
+    # Download images before replying and upload them, instead of linking Discord to the generator
+    IMAGE_PREFETCH = os.getenv("IMAGE_PREFETCH", "true").lower() == "true"
+    # Upstream image fetches in flight at once per guild, e.g. for /imagine count
+    IMAGE_GUILD_CONCURRENCY = int(os.getenv("IMAGE_GUILD_CONCURRENCY", 4))
+    # Past a model's rolling p95 (bounded by the SLO) the request is hedged to a faster model
+    IMAGE_HEDGING = os.getenv("IMAGE_HEDGING", "true").lower() == "true"
+    IMAGE_SLO_SECONDS = float(os.getenv("IMAGE_SLO_SECONDS", 20))
+    IMAGE_HEDGE_PERCENTILE = float(os.getenv("IMAGE_HEDGE_PERCENTILE", 95))
+    IMAGE_HEDGE_MIN_DELAY = float(os.getenv("IMAGE_HEDGE_MIN_DELAY", 2))
+    IMAGE_HEDGE_MIN_SAMPLES = int(os.getenv("IMAGE_HEDGE_MIN_SAMPLES", 5))
+    IMAGE_STATS_WINDOW = int(os.getenv("IMAGE_STATS_WINDOW", 100))
+
+    # Offload: run generations on the Celery workers (/workers) instead of in the bot process
+    WORKER_OFFLOAD = os.getenv("WORKER_OFFLOAD", "false").lower() == "true"
+    # "memory://" runs tasks eagerly in-process, for trying offload mode without Redis
+    CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL") or os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND") or CELERY_BROKER_URL
+    OFFLOAD_TIMEOUT = float(os.getenv("OFFLOAD_TIMEOUT", 90))
+    OFFLOAD_POLL_INTERVAL = float(os.getenv("OFFLOAD_POLL_INTERVAL", 0.25))
+    # Threads for broker and result backend calls (and for running tasks in "memory://" mode)
+    OFFLOAD_THREADS = int(os.getenv("OFFLOAD_THREADS", 4))
+
 config = Config()
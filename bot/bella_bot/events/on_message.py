@@ -1,164 +1,297 @@
-import discord
-import os
 import asyncio
-import httpx
-from ..services.ai_service import AIService
-from ..services.image_service import ImageService
+import discord
+import math
+from ..services.ai_service import ai_service
+from ..services.image_service import image_service
 from ..services.memory_service import MemoryService
+from ..services.behavior_service import BehaviorService
+from ..services.behavior_sync import BehaviorSync
+from ..services.compaction_service import CompactionService
+from ..services.conversation_service import ConversationService, Turn
+from ..services.event_publisher import event_publisher
+from ..services.reply_streamer import StreamedReply
+from ..services.offload_service import offload_service
+from ..services.admission_service import (
+    admission_service, Rejected, PRIORITY_OWNER, PRIORITY_MENTION, PRIORITY_NORMAL
+)
+from ..cache import TTLCache
+from ..coalescer import MessageCoalescer
+from ..image_reply import image_message
 from ..config import config
+from ..triggers import TriggerMatcher
 
-ai_service = AIService()
-image_service = ImageService(
-    default_model=config.IMAGE_MODEL,
-    auth_token=config.POLLINATIONS_TOKEN
-)
 memory_service = MemoryService()
+behavior_service = BehaviorService()
+behavior_sync = BehaviorSync(behavior_service)
+compaction_service = CompactionService(memory_service, ai_service)
+conversation_service = ConversationService()
+
+# Rate limits and queue depth go to the dashboard as admission_stats events
+admission_service.on_stats = lambda stats: event_publisher.publish({'type': 'admission_stats', 'payload': stats})
+# The API serves image latency percentiles, but the bot is where most images are generated
+image_service.on_stats = lambda stats: event_publisher.publish({'type': 'image_stats', 'payload': stats})
+coalescer = MessageCoalescer(config.COALESCE_WINDOW)
+slow_down_notices = TTLCache(maxsize=10000, ttl=config.ADMISSION_NOTICE_INTERVAL)
+
+# Detection Keywords
+BELLA_NAMES = [
+    'bella', 'bela',
+    'بيلا', 'بللا', 'بلا'
+]
+
+IMAGE_TRIGGERS = [
+    # Verbs
+    "generate", "create", "make", "draw", "imagine", "gen",
+    "paint", "design", "سوي", "اصنع", "ارسم", "صمم", "اعمل", "صور",
+    "رسم", "تخيل",
+    # Nouns (Contextual triggers)
+    "image", "picture", "art", "drawing", "photo", "pic", "صورة",
+    "رسمة", "فن", "تصميم", "صوره",
+    # Legacy/Specific
+    "create image", "اصنعي صورة"
+]
+
+trigger_matcher = TriggerMatcher(BELLA_NAMES, IMAGE_TRIGGERS)
+
+
+async def slow_down(message, rejection: Rejected):
+    """Answer a rejected request right away, at most once per user per notice interval"""
+    user_id = str(message.author.id)
+    if slow_down_notices.get(user_id):
+        return
+    slow_down_notices.set(user_id, True)
+    wait = max(1, math.ceil(rejection.retry_after))
+    text = "⏳ Slow down a little!" if rejection.reason == "rate" else "⏳ I'm swamped right now!"
+    await message.reply(f"{text} Try again in {wait}s.", delete_after=10)
+
+
+def clean_content(message) -> str:
+    """Message text without user mentions"""
+    clean_message = message.content
+    for mention in message.mentions:
+        clean_message = clean_message.replace(f"<@{mention.id}>", "").replace(f"<@!{mention.id}>", "")
+    return clean_message
+
+
+async def respond(bot, items: list, commit):
+    """
+    Answer a coalesced burst of (message, clean_message, priority) from one user in one reply.
+
+    Rate tokens were taken when the burst started (see on_message), so runs that
+    are cancelled and redone as the burst grows only queue for a slot.
+    """
+    message = items[-1][0]  # Reply under the latest line
+    clean_message = "\n".join(text.strip() for _, text, _ in items if text.strip())
+    priority = min(p for _, _, p in items)
+
+    async with message.channel.typing():
+        try:
+            async with admission_service.admit(
+                str(message.author.id),
+                str(message.guild.id) if message.guild else None,
+                priority,
+                charge=False
+            ):
+                await chat_reply(bot, message, clean_message, commit)
+        except Rejected as e:
+            commit()
+            await slow_down(message, e)
+
+
+async def chat_reply(bot, message, clean_message: str, commit=None):
+    """
+    Generate and post a reply with the user's memory, channel history and persona.
+
+    `commit` is called right before anything is posted; from then on the reply
+    is no longer cancelled in favour of a merged burst.
+    """
+    # 1. Update User State & Get Memory
+    user_roles = [r.name for r in message.author.roles] if hasattr(message.author, 'roles') else []
+    user_memory = await memory_service.touch_and_get(str(message.author.id), str(message.author), user_roles)
+
+    # 2. Build Context
+    context_parts = [
+        f"User: {message.author.display_name} (ID: {message.author.id})",
+        f"Roles: {', '.join(user_roles) if user_roles else 'None'}"
+    ]
+    if user_memory.get("summary"):
+        context_parts.append(f"SUMMARY: {user_memory['summary']}")
+    facts = await memory_service.get_relevant_facts(str(message.author.id), clean_message)
+    if facts:
+        context_parts.append("KNOWN FACTS:")
+        context_parts.extend([f"- {fact}" for fact in facts])
 
+    # Recent turns in this channel, plus the message being replied to
+    reply_to = None
+    referenced = message.reference.resolved if message.reference else None
+    if isinstance(referenced, discord.Message) and referenced.content:
+        role = "model" if referenced.author == bot.user else "user"
+        content = referenced.content if role == "model" else f"{referenced.author.display_name}: {referenced.content}"
+        reply_to = Turn(role, content, referenced.id)
+    history = conversation_service.history(message.channel.id, reply_to)
+
+    # 3. Resolve Prompt
+    system_prompt = behavior_service.resolve_system_instruction(str(message.author.id), user_roles)
+
+    # 4. Generate with Context & Prompt
+    # Replies posted so far. If the run is cancelled (the message was deleted or edited)
+    # they are removed, so neither half an answer nor a stale one is left behind a redo.
+    sent = []
+
+    async def send(text: str):
+        if commit:
+            commit()
+        reply = await message.reply(text)
+        sent.append(reply)
+        return reply
 
-async def _post_event(payload: dict):
-    # Send event to dashboard API if configured; fire-and-forget
-    api_base = os.getenv('BOT_PUBLIC_URL') or os.getenv('VITE_API_BASE_URL') or 'http://localhost:8000'
-    url = api_base.rstrip('/') + '/events'
     try:
-        async with httpx.AsyncClient() as client:
-            await client.post(url, json=payload, timeout=5)
-    except Exception:
-        # Don't let dashboard failures affect bot behavior
-        pass
+        # Worker results arrive whole, so offloaded replies aren't streamed
+        if config.STREAM_REPLIES and offload_service is None:
+            # Post the first tokens right away and keep editing as the rest arrives
+            stream = ai_service.generate_response_stream(
+                clean_message,
+                conversation_history=history,
+                user_context="\n".join(context_parts),
+                system_instruction=system_prompt
+            )
+            response, new_memories = await StreamedReply(send).run(stream)
+        else:
+            generator = offload_service or ai_service
+            response, new_memories = await generator.generate_response(
+                clean_message, 
+                conversation_history=history,
+                user_context="\n".join(context_parts),
+                system_instruction=system_prompt
+            )
+
+            # Discord has a 2000 character limit per message
+            for i in range(0, len(response), 2000):
+                await send(response[i:i+2000])
+
+        # 5. Save New Memories
+        for memory in new_memories:
+            await memory_service.add_memory_fact(str(message.author.id), memory)
+        conversation_service.add(message.channel.id, "user", f"{message.author.display_name}: {clean_message}", message.id)
+        conversation_service.add(message.channel.id, "model", response)
+        compaction_service.record_exchange(str(message.author.id), clean_message, response)
+        await compaction_service.maybe_schedule(str(message.author.id))
+    except asyncio.CancelledError:
+        await asyncio.gather(*(reply.delete() for reply in sent), return_exceptions=True)
+        raise
+
+    # Notify dashboard
+    event_publisher.publish({
+        'type': 'mention_reply',
+        'payload': {
+            'author': str(message.author),
+            'guild': str(message.guild.id) if message.guild else None,
+            'channel': str(message.channel),
+            'content': clean_message,
+            'response': response[:2000]
+        }
+    })
 
 
 async def setup(bot):
+    # on_ready (and so setup) can run again after a reconnect
+    for hook in (compaction_service.close, memory_service.close, event_publisher.close,
+                 behavior_sync.close, behavior_service.flush, image_service.close, coalescer.close):
+        if hook not in bot.shutdown_hooks:
+            bot.shutdown_hooks.append(hook)
+
+    # Picks up persona edits made through the dashboard API
+    await behavior_sync.start()
+
     @bot.event
     async def on_message(message):
         if message.author == bot.user:
             return
 
-        content = message.content.lower().strip()
+        content = message.content.strip()
         
-        # 1. Detection Keywords
-        bella_names = [
-            'bella', 'bela',
-            'بيلا', 'بللا', 'بلا'
-        ]
-        
-        image_triggers = [
-            # Verbs
-            "generate", "create", "make", "draw", "imagine", "gen",
-            "paint", "design", "سوي", "اصنع", "ارسم", "صمم", "اعمل", "صور",
-            "رسم", "تخيل",
-            # Nouns (Contextual triggers)
-            "image", "picture", "art", "drawing", "photo", "pic", "صورة",
-            "رسمة", "فن", "تصميم", "صوره",
-            # Legacy/Specific
-            "create image", "اصنعي صورة"
-        ]
+        # 1. Detection: names, image triggers and mentions in one pass
+        match = trigger_matcher.match(message.content)
 
         # 2. Check Triggers
-        is_bella_mentioned = any(name in content for name in bella_names)
+        is_bella_mentioned = bool(match.names)
         is_direct_mention = bot.user in message.mentions or content.startswith(f"<@{bot.user.id}>")
         
         should_respond = is_direct_mention or is_bella_mentioned
         
         # 3. Handle Response (if triggered and not a slash command)
-        if should_respond and not content.startswith('/'):
+        is_slash = content.startswith('/')
+
+        # Image Generation Request
+        if should_respond and match.triggers and not is_slash:
             async with message.channel.typing():
-                
-                # Check for Image Generation Request
-                is_image_request = any(trigger in content for trigger in image_triggers)
-                
-                if is_image_request:
-                    # Clean up prompt: remove trigger words and bella names
-                    prompt = message.content # Use original case for prompt
-                    clean_content_lower = content
-                    
-                    # Remove mentions first
-                    for mention in message.mentions:
-                        prompt = prompt.replace(f"<@{mention.id}>", "").replace(f"<@!{mention.id}>", "")
-                        clean_content_lower = clean_content_lower.replace(f"<@{mention.id}>", "").replace(f"<@!{mention.id}>", "")
-
-                    # Remove keywords (simple remove)
-                    for word in bella_names + image_triggers:
-                        # Case insensitive remove logic could be complex, 
-                        # but simplistic replace on lowercase check is hard on original string
-                        # Let's just strip known triggers from the prompt roughly
-                        if word in prompt.lower():
-                             # This is a bit rough, but works for "Bella draw cat" -> " cat"
-                             # proper regex replace ignoring case is better but keep it simple
-                             import re
-                             prompt = re.sub(re.escape(word), '', prompt, flags=re.IGNORECASE)
-                    
-                    prompt = prompt.strip()
-                    if not prompt or len(prompt) < 2:
-                        prompt = "artistic masterpiece" # Fallback
-                        
-                    try:
-                        image_url = await image_service.generate_image(prompt)
-                        
-                        embed = discord.Embed(title="🎨 Here is your image!", color=discord.Color.purple())
-                        embed.set_image(url=image_url)
-                        embed.set_footer(text=f"Prompt: {prompt}")
-                        await message.reply(embed=embed)
-                        
-                        asyncio.create_task(_post_event({
-                            'type': 'image_generated',
-                            'payload': {'author': str(message.author), 'prompt': prompt}
-                        }))
-                        return # Done
-                    except Exception as e:
-                        await message.reply(f"❌ I encountered an error generating that image.")
-                        print(f"Image Gen Error: {e}")
-                        return
-
-                # Normal Chat Response
-                clean_message = message.content
-                for mention in message.mentions:
-                    clean_message = clean_message.replace(f"<@{mention.id}>", "").replace(f"<@!{mention.id}>", "")
-                
-                # 1. Update User State & Get Memory
-                user_roles = [r.name for r in message.author.roles] if hasattr(message.author, 'roles') else []
-                await memory_service.update_user_interaction(str(message.author.id), str(message.author), user_roles)
-                user_memory = await memory_service.get_memory(str(message.author.id))
-                
-                # 2. Build Context
-                context_parts = [
-                    f"User: {message.author.display_name} (ID: {message.author.id})",
-                    f"Roles: {', '.join(user_roles) if user_roles else 'None'}"
-                ]
-                if user_memory.get("facts"):
-                    context_parts.append("KNOWN FACTS:")
-                    context_parts.extend([f"- {fact}" for fact in user_memory["facts"]])
-                
-                # 3. Resolve Prompt
-                system_prompt = behavior_service.resolve_system_instruction(str(message.author.id), user_roles)
-                
-                # 4. Generate with Context & Prompt
-                response, new_memories = await ai_service.generate_response(
-                    clean_message, 
-                    user_context="\n".join(context_parts),
-                    system_instruction=system_prompt
+                # Clean up prompt: splice out trigger words, bella names and mentions
+                prompt = trigger_matcher.strip(message.content, match)
+                if not prompt or len(prompt) < 2:
+                    prompt = "artistic masterpiece" # Fallback
+
+                try:
+                    embed = discord.Embed(title="🎨 Here is your image!", color=discord.Color.purple())
+                    embed.set_footer(text=f"Prompt: {prompt}")
+                    guild_id = message.guild.id if message.guild else None
+                    await message.reply(**await image_message(guild_id, embed, prompt=prompt))
+
+                    event_publisher.publish({
+                        'type': 'image_generated',
+                        'payload': {
+                            'author': str(message.author),
+                            'guild': str(message.guild.id) if message.guild else None,
+                            'prompt': prompt
+                        }
+                    })
+                    return # Done
+                except Exception as e:
+                    await message.reply(f"❌ I encountered an error generating that image.")
+                    print(f"Image Gen Error: {e}")
+                    return
+
+        # Normal Chat Response
+        # Lines the same user sends right after triggering a reply are folded into it
+        batch_key = (message.channel.id, message.author.id)
+        if (should_respond or coalescer.is_open(batch_key)) and not is_slash:
+            priority = PRIORITY_NORMAL
+            if await bot.is_owner(message.author):
+                priority = PRIORITY_OWNER
+            elif is_direct_mention:
+                priority = PRIORITY_MENTION
+
+            rejection = None
+            if not coalescer.is_open(batch_key):
+                # One reply per burst, so it is rate limited once, not once per debounced run
+                try:
+                    admission_service.charge(str(message.author.id), str(message.guild.id) if message.guild else None)
+                except Rejected as e:
+                    rejection = e
+
+            if rejection is None:
+                coalescer.submit(
+                    batch_key,
+                    (message, clean_content(message), priority),
+                    lambda items, commit: respond(bot, items, commit),
+                    item_id=message.id
                 )
-                
-                # 5. Save New Memories
-                for memory in new_memories:
-                    await memory_service.add_memory_fact(str(message.author.id), memory)
-                
-                if len(response) > 2000:
-                    chunks = [response[i:i+2000] for i in range(0, len(response), 2000)]
-                    for chunk in chunks:
-                        await message.reply(chunk)
-                else:
-                    await message.reply(response)
-
-                # Notify dashboard
-                asyncio.create_task(_post_event({
-                    'type': 'mention_reply',
-                    'payload': {
-                        'author': str(message.author),
-                        'channel': str(message.channel),
-                        'content': clean_message,
-                        'response': response[:2000]
-                    }
-                }))
+            else:
+                await slow_down(message, rejection)
 
         # Process commands
         await bot.process_commands(message)
+
+    @bot.event
+    async def on_message_delete(message):
+        # Stop paying for a reply nobody will read
+        coalescer.withdraw(message.id)
+
+    @bot.event
+    async def on_message_edit(before, after):
+        # Embeds resolving also fire edits, so only react to changed text
+        if before.content == after.content or after.author == bot.user:
+            return
+        # Only messages with a reply in flight are regenerated
+        item = coalescer.get(after.id)
+        if item is not None:
+            coalescer.replace(after.id, (after, clean_content(after), item[2]))
@@ -0,0 +1,42 @@
+from io import BytesIO
+import math
+
+try:
+    from PIL import Image, ImageDraw
+except ImportError:  # Optional: without it variations are sent as separate attachments
+    Image = None
+
+
+def available() -> bool:
+    return Image is not None
+
+
+def compose_grid(images: list[bytes], cell_size: int = 512, gap: int = 8) -> bytes:
+    """
+    Lay images out in a near-square grid, numbered in reading order.
+
+    Cells are cell_size wide and keep the first image's aspect ratio. CPU bound,
+    so call it through asyncio.to_thread.
+    """
+    if Image is None:
+        raise RuntimeError("Pillow is not installed")
+
+    opened = [Image.open(BytesIO(data)).convert("RGB") for data in images]
+    cols = math.ceil(math.sqrt(len(opened)))
+    rows = math.ceil(len(opened) / cols)
+    cell_w = cell_size
+    cell_h = round(cell_size * opened[0].height / opened[0].width)
+
+    grid = Image.new("RGB", (cols * cell_w + (cols - 1) * gap, rows * cell_h + (rows - 1) * gap), "black")
+    draw = ImageDraw.Draw(grid)
+    for i, img in enumerate(opened):
+        x = (i % cols) * (cell_w + gap)
+        y = (i // cols) * (cell_h + gap)
+        grid.paste(img.resize((cell_w, cell_h)), (x, y))
+        # Number badge matching the buttons under the preview
+        draw.rectangle((x, y, x + 28, y + 24), fill="black")
+        draw.text((x + 10, y + 6), str(i + 1), fill="white")
+
+    out = BytesIO()
+    grid.save(out, format="JPEG", quality=85)
+    return out.getvalue()
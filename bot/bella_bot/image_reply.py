@@ -0,0 +1,43 @@
+import asyncio
+import discord
+from io import BytesIO
+from .config import config
+from .services.image_service import image_service
+from .services.offload_service import offload_service
+
+# guild id -> semaphore capping concurrent upstream fetches, so one server can't hog the generator
+_guild_semaphores = {}
+
+
+def _guild_semaphore(guild_id) -> asyncio.Semaphore:
+    semaphore = _guild_semaphores.get(guild_id)
+    if semaphore is None:
+        semaphore = _guild_semaphores[guild_id] = asyncio.Semaphore(config.IMAGE_GUILD_CONCURRENCY)
+    return semaphore
+
+
+async def fetch_image(guild_id, **request) -> tuple[bytes, str]:
+    """Image bytes and cache key, from the workers in offload mode and in-process otherwise"""
+    async with _guild_semaphore(guild_id):
+        if offload_service is not None:
+            # Workers only know the configured default, not a model picked with /imagemodel
+            request = {**request, "model": request.get("model") or image_service.get_current_model()}
+            return await offload_service.fetch_image(**request)
+        return await image_service.fetch_image(**request)
+
+
+async def image_message(guild_id, embed: discord.Embed, **request) -> dict:
+    """Send kwargs for one image: uploaded when prefetching works, linked otherwise"""
+    send_kwargs = {"embed": embed}
+    if config.IMAGE_PREFETCH:
+        # Upload the finished image so it shows the moment the message appears
+        try:
+            data, key = await fetch_image(guild_id, **request)
+            filename = image_service.attachment_name(key, data)
+            send_kwargs["file"] = discord.File(BytesIO(data), filename=filename)
+            embed.set_image(url=f"attachment://{filename}")
+        except Exception as e:
+            print(f"Image prefetch failed, linking instead: {e}")
+    if "file" not in send_kwargs:
+        embed.set_image(url=await image_service.generate_image(**request))
+    return send_kwargs
@@ -0,0 +1,192 @@
+from contextlib import asynccontextmanager
+from ..cache import TTLCache
+from ..config import config
+import asyncio
+import heapq
+import itertools
+import time
+
+# Lower runs first
+PRIORITY_OWNER = 0
+PRIORITY_MENTION = 1
+PRIORITY_NORMAL = 2
+
+
+class Rejected(Exception):
+    """A generation was refused; `retry_after` is a hint in seconds"""
+
+    def __init__(self, reason: str, retry_after: float = 0):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Allows `capacity` requests at once, refilled at `rate` per second"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        """Seconds until a token is available (after refill)"""
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+
+class AdmissionService:
+    """
+    Gate in front of Gemini calls.
+
+    A request needs a token from its user's, its guild's and the global bucket,
+    then one of `max_active` generation slots. Requests waiting for a slot sit in
+    a bounded priority queue (owner, then direct mentions, then the rest); when it
+    is full the lowest priority request is turned away, and nobody waits longer
+    than `queue_timeout`. Rejections raise Rejected so callers can answer
+    "slow down" right away instead of leaving the user hanging.
+    """
+
+    def __init__(self, max_active: int = None, max_queue: int = None, queue_timeout: float = None):
+        self.max_active = max_active or config.ADMISSION_MAX_ACTIVE
+        self.max_queue = max_queue or config.ADMISSION_QUEUE_SIZE
+        self.queue_timeout = queue_timeout or config.ADMISSION_QUEUE_TIMEOUT
+
+        # Idle buckets are full again after capacity / rate seconds, so they can be forgotten
+        self._user_buckets = TTLCache(maxsize=10000, ttl=3600)
+        self._guild_buckets = TTLCache(maxsize=10000, ttl=3600)
+        self._global_bucket = TokenBucket(config.ADMISSION_GLOBAL_RATE, config.ADMISSION_GLOBAL_BURST)
+
+        self._active = 0
+        self._queue = []  # heap of (priority, seq, future)
+        self._seq = itertools.count()
+        self.stats = {"admitted": 0, "rejected_rate": 0, "rejected_busy": 0, "timed_out": 0}
+        self.on_stats = None  # Called with get_stats() at most every ADMISSION_STATS_INTERVAL, and once after a burst
+        self._last_stats = 0.0
+        self._trailing_stats = None  # Publishes the final state of a burst that was throttled
+
+    def _bucket(self, cache: TTLCache, key, rate: float, burst: float) -> TokenBucket:
+        bucket = cache.get(key)
+        if bucket is None:
+            bucket = TokenBucket(rate, burst)
+        cache.set(key, bucket)  # Refresh the TTL while the key is active
+        return bucket
+
+    def _take_tokens(self, user_id: str, guild_id: str | None):
+        now = time.monotonic()
+        buckets = [
+            self._bucket(self._user_buckets, user_id, config.ADMISSION_USER_RATE, config.ADMISSION_USER_BURST),
+            self._global_bucket,
+        ]
+        if guild_id is not None:
+            buckets.append(self._bucket(self._guild_buckets, guild_id, config.ADMISSION_GUILD_RATE, config.ADMISSION_GUILD_BURST))
+        for bucket in buckets:
+            bucket.refill(now)
+
+        # All or nothing, so a rejection doesn't also drain the other buckets
+        wait = max(bucket.wait_time() for bucket in buckets)
+        if wait > 0:
+            self.stats["rejected_rate"] += 1
+            self._changed()
+            raise Rejected("rate", wait)
+        for bucket in buckets:
+            bucket.tokens -= 1
+
+    def charge(self, user_id: str, guild_id: str = None):
+        """Take rate tokens now, or raise Rejected, for a request admitted later with charge=False"""
+        self._take_tokens(user_id, guild_id)
+
+    async def acquire(self, user_id: str, guild_id: str = None, priority: int = PRIORITY_NORMAL, charge: bool = True):
+        """Wait for a generation slot or raise Rejected; pair with release()"""
+        if charge:
+            self._take_tokens(user_id, guild_id)
+
+        if self._active < self.max_active and not self._queue:
+            self._active += 1
+            self.stats["admitted"] += 1
+            self._changed()
+            return
+
+        if len(self._queue) >= self.max_queue:
+            # Make room by turning away the lowest priority, newest waiter if it ranks below us
+            worst = max(self._queue)
+            if worst[0] <= priority:
+                self.stats["rejected_busy"] += 1
+                self._changed()
+                raise Rejected("busy", self.queue_timeout)
+            self._queue.remove(worst)
+            heapq.heapify(self._queue)
+            worst[2].set_exception(Rejected("busy", self.queue_timeout))
+            self.stats["rejected_busy"] += 1
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self._seq), future)
+        heapq.heappush(self._queue, entry)
+        self._changed()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._abandon(entry)
+            self.stats["timed_out"] += 1
+            self._changed()
+            raise Rejected("busy", self.queue_timeout)
+        except asyncio.CancelledError:
+            self._abandon(entry)
+            raise
+        self.stats["admitted"] += 1
+        self._changed()
+
+    def _abandon(self, entry):
+        if entry in self._queue:
+            self._queue.remove(entry)
+            heapq.heapify(self._queue)
+        elif entry[2].done() and not entry[2].cancelled() and entry[2].exception() is None:
+            # The slot was handed over just as we gave up; pass it on
+            self.release()
+
+    def release(self):
+        # Hand the slot straight to the best waiter, so it can't be taken by a newcomer
+        while self._queue:
+            _, _, future = heapq.heappop(self._queue)
+            if not future.done():
+                future.set_result(None)
+                self._changed()
+                return
+        self._active -= 1
+        self._changed()
+
+    @asynccontextmanager
+    async def admit(self, user_id: str, guild_id: str = None, priority: int = PRIORITY_NORMAL, charge: bool = True):
+        await self.acquire(user_id, guild_id, priority, charge)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "active": self._active, "queued": len(self._queue), "max_active": self.max_active, "max_queue": self.max_queue}
+
+    def _changed(self):
+        if self.on_stats is None:
+            return
+        wait = self._last_stats + config.ADMISSION_STATS_INTERVAL - time.monotonic()
+        if wait <= 0:
+            self._publish_stats()
+        elif self._trailing_stats is None:
+            self._trailing_stats = asyncio.get_running_loop().call_later(wait, self._publish_stats)
+
+    def _publish_stats(self):
+        if self._trailing_stats is not None:
+            self._trailing_stats.cancel()
+            self._trailing_stats = None
+        self._last_stats = time.monotonic()
+        self.on_stats(self.get_stats())
+
+
+admission_service = AdmissionService()
@@ -1,10 +1,24 @@
-import os
+import asyncio
+import re
 from google import genai
 from google.genai import types
 from ..config import config
 
+# Returned (or streamed) in place of an answer when generation fails
+TIMEOUT_RESPONSE = "Sorry, that took me too long to answer. Please try again."
+ERROR_PREFIXES = ("Error: ", "Error generating response: ")
+
+
+def is_failure(text: str) -> bool:
+    """True for the stand-in texts generate_response and generate_response_stream give on errors"""
+    return text == TIMEOUT_RESPONSE or text.startswith(ERROR_PREFIXES)
+
+
+MEMORY_INSTRUCTION = "SYSTEM: If you learn a new IMPORTANT fact about the user, specifically likes, dislikes, names, or key details, save it by adding [MEMORY: the fact] at the end of your response."
+
+
 class AIService:
-    def __init__(self):
+    def __init__(self, max_concurrency: int = None, request_timeout: float = None):
         self.client = genai.Client(api_key=config.GEMINI_API_KEY)
         self.model = "gemini-flash-lite-latest"
         self.tools = [
@@ -12,6 +26,11 @@ class AIService:
             types.Tool(code_execution=types.ToolCodeExecution),
             types.Tool(googleSearch=types.GoogleSearch()),
         ]
+        # Bounds how many Gemini streams this instance keeps open at once; the bot shares
+        # the module-level ai_service so the limit holds for the whole process
+        self.max_concurrency = max_concurrency or config.AI_MAX_CONCURRENCY
+        self.request_timeout = request_timeout or config.AI_REQUEST_TIMEOUT
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
 
     def _create_config(self, system_instruction: str = None):
         config_kwargs = {
@@ -30,109 +49,145 @@ class AIService:
             
         return conf
 
-    async def generate_response(self, message: str, conversation_history: list = None, user_context: str = None, system_instruction: str = None) -> tuple[str, list[str]]:
-        """
-        Generate a response from Gemini.
-        """
-        # Prepare System Instruction
-        base_instruction = system_instruction or ""
-        full_instruction = base_instruction
+    def _build_instruction(self, system_instruction: str = None, user_context: str = None) -> str:
+        """Combine persona prompt, user context and the memory tag instruction"""
+        full_instruction = system_instruction or ""
         if user_context:
-            full_instruction = f"{base_instruction}\n\nCONTEXT:\n{user_context}".strip()
-            
-        full_instruction += "\n\nSYSTEM: If you learn a new IMPORTANT fact about the user, specifically likes, dislikes, names, or key details, save it by adding [MEMORY: the fact] at the end of your response."
+            full_instruction = f"{full_instruction}\n\nCONTEXT:\n{user_context}".strip()
 
-        # Create Config for this request
-        req_config = self._create_config(full_instruction)
+        return f"{full_instruction}\n\n{MEMORY_INSTRUCTION}"
 
-        try:
-            contents = []
-            if conversation_history:
-                for msg in conversation_history:
-                    contents.append(
-                        types.Content(
-                            role=msg.get("role", "user"),
-                            parts=[types.Part.from_text(text=msg.get("content", ""))],
-                        )
+    def _build_contents(self, message: str, conversation_history: list = None) -> list:
+        contents = []
+        if conversation_history:
+            for msg in conversation_history:
+                contents.append(
+                    types.Content(
+                        role=msg.get("role", "user"),
+                        parts=[types.Part.from_text(text=msg.get("content", ""))],
                     )
-            
-            contents.append(
-                types.Content(
-                    role="user",
-                    parts=[types.Part.from_text(text=message)],
                 )
+
+        contents.append(
+            types.Content(
+                role="user",
+                parts=[types.Part.from_text(text=message)],
             )
-            
+        )
+        return contents
+
+    @staticmethod
+    def _chunk_text(chunk) -> str:
+        if (
+            chunk.candidates is None
+            or chunk.candidates[0].content is None
+            or chunk.candidates[0].content.parts is None
+        ):
+            return ""
+
+        part = chunk.candidates[0].content.parts[0]
+        text = ""
+        if part.text:
+            text += part.text
+        if part.executable_code:
+            text += f"\n[Code: {part.executable_code}]\n"
+        if part.code_execution_result:
+            text += f"\n[Result: {part.code_execution_result}]\n"
+        return text
+
+    async def _stream_text(self, contents: list, req_config):
+        """
+        Yield text pieces from the async Gemini client.
+
+        Holds a concurrency slot for the lifetime of the stream and enforces
+        `request_timeout` as a deadline over the whole generation.
+        """
+        loop = asyncio.get_running_loop()
+        async with self._semaphore:
+            deadline = loop.time() + self.request_timeout
+            stream = await asyncio.wait_for(
+                self.client.aio.models.generate_content_stream(
+                    model=self.model,
+                    contents=contents,
+                    config=req_config,
+                ),
+                self.request_timeout,
+            )
+            try:
+                while True:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        raise asyncio.TimeoutError()
+                    try:
+                        chunk = await asyncio.wait_for(anext(stream), remaining)
+                    except StopAsyncIteration:
+                        break
+
+                    text = self._chunk_text(chunk)
+                    if text:
+                        yield text
+            finally:
+                aclose = getattr(stream, "aclose", None)
+                if aclose is not None:
+                    try:
+                        await aclose()
+                    except Exception:
+                        pass
+
+    async def generate_response(self, message: str, conversation_history: list = None, user_context: str = None, system_instruction: str = None) -> tuple[str, list[str]]:
+        """
+        Generate a response from Gemini.
+        """
+        req_config = self._create_config(self._build_instruction(system_instruction, user_context))
+        contents = self._build_contents(message, conversation_history)
+
+        try:
             full_response = ""
-            for chunk in self.client.models.generate_content_stream(
-                model=self.model,
-                contents=contents,
-                config=req_config,
-            ):
-                if (
-                    chunk.candidates is None
-                    or chunk.candidates[0].content is None
-                    or chunk.candidates[0].content.parts is None
-                ):
-                    continue
-                
-                part = chunk.candidates[0].content.parts[0]
-                if part.text:
-                    full_response += part.text
-                if part.executable_code:
-                    full_response += f"\n[Code: {part.executable_code}]\n"
-                if part.code_execution_result:
-                    full_response += f"\n[Result: {part.code_execution_result}]\n"
+            async for text in self._stream_text(contents, req_config):
+                full_response += text
             
             final_text = full_response.strip() if full_response.strip() else "I'm sorry, I couldn't generate a response."
             
             memory_updates = []
             if "[MEMORY:" in final_text:
-                import re
                 matches = re.findall(r'\[MEMORY: (.*?)\]', final_text, re.IGNORECASE)
                 memory_updates = matches
                 final_text = re.sub(r'\[MEMORY:.*?\]', '', final_text, flags=re.IGNORECASE).strip()
 
             return final_text, memory_updates
             
+        except asyncio.TimeoutError:
+            return TIMEOUT_RESPONSE, []
         except Exception as e:
             return f"Error generating response: {str(e)}", []
 
-    async def generate_response_stream(self, message: str, conversation_history: list = None):
-        # Default stream (no special context/system for simple stream for now)
-        req_config = self._create_config()
+    async def summarize(self, text: str, instruction: str, max_output_tokens: int = 256) -> str | None:
+        """Plain low-temperature completion without tools, used for background jobs"""
+        req_config = types.GenerateContentConfig(
+            temperature=0.3,
+            max_output_tokens=max_output_tokens,
+            system_instruction=types.Part.from_text(text=instruction),
+        )
         try:
-            contents = []
-            if conversation_history:
-                for msg in conversation_history:
-                    contents.append(
-                        types.Content(
-                            role=msg.get("role", "user"),
-                            parts=[types.Part.from_text(text=msg.get("content", ""))],
-                        )
-                    )
-            contents.append(
-                types.Content(
-                    role="user",
-                    parts=[types.Part.from_text(text=message)],
-                )
-            )
-            
-            for chunk in self.client.models.generate_content_stream(
-                model=self.model,
-                contents=contents,
-                config=req_config,
-            ):
-                if (
-                    chunk.candidates is None
-                    or chunk.candidates[0].content is None
-                    or chunk.candidates[0].content.parts is None
-                ):
-                    continue
-                
-                part = chunk.candidates[0].content.parts[0]
-                if part.text:
-                    yield part.text
-                    
+            summary = ""
+            async for piece in self._stream_text(self._build_contents(text), req_config):
+                summary += piece
+            return summary.strip() or None
         except Exception as e:
-            yield f"Error: {str(e)}"
\ No newline at end of file
+            print(f"Error generating summary: {e}")
+            return None
+
+    async def generate_response_stream(self, message: str, conversation_history: list = None, user_context: str = None, system_instruction: str = None):
+        """Yield raw response text as it arrives (memory tags are left in place)"""
+        req_config = self._create_config(self._build_instruction(system_instruction, user_context))
+        contents = self._build_contents(message, conversation_history)
+        try:
+            async for text in self._stream_text(contents, req_config):
+                yield text
+        except asyncio.TimeoutError:
+            yield TIMEOUT_RESPONSE
+        except Exception as e:
+            yield f"Error: {str(e)}"
+
+
+ai_service = AIService()
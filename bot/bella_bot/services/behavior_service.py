@@ -1,31 +1,66 @@
+import asyncio
 import json
 import os
+import tempfile
 from typing import Dict, List, Optional
+from ..cache import TTLCache
+from ..config import config
 
 class BehaviorService:
+    # Mutators that can be replayed from another process (see BehaviorSync)
+    SYNCED_OPS = (
+        "update_persona", "delete_persona", "assign_user", "assign_role",
+        "set_default_persona", "set_global_guidelines", "set_role_priority",
+    )
+
     def __init__(self, file_path="behaviors.json"):
         self.file_path = file_path
+        self.backup_path = f"{file_path}.bak"
         self.data = {
             "personas": {},
             "assignments": {"users": {}, "roles": {}},
             "default_persona": "default",
-            "global_guidelines": ""
+            "global_guidelines": "",
+            "version": 0
         }
+        self.save_delay = config.BEHAVIOR_SAVE_DELAY
+        self._dirty = False
+        self._save_handle = None
+        self._write_lock = None
+
+        # Resolution index, rebuilt lazily whenever the generation moves on
+        self._generation = 0
+        self._index_generation = -1
+        self._user_personas = {}
+        self._role_ranks = {}   # role name -> (priority, persona id)
+        self._prompts = {}      # persona id -> rendered system instruction
+        self._resolved = TTLCache(maxsize=config.BEHAVIOR_CACHE_SIZE, ttl=None)
+
+        # Called with (op, args) after every local mutation, unless the mutation is itself a replay
+        self.on_change = None
+        self._replaying = False
         self.load()
 
     def load(self):
-        if os.path.exists(self.file_path):
-            try:
-                with open(self.file_path, 'r', encoding='utf-8') as f:
-                    content = json.load(f)
-                    # Migration from old list format to new Controller format
-                    if "behaviors" in content and isinstance(content["behaviors"], list):
-                        self.migrate_legacy(content["behaviors"])
-                    else:
-                        self.data = content
-            except Exception:
-                # If file is corrupt, backup and start fresh? Or just start fresh.
-                print("Error loading behaviors.json, starting fresh.")
+        if os.path.exists(self.file_path) or os.path.exists(self.backup_path):
+            # The previous snapshot is kept as a backup in case the main file is damaged
+            for path in (self.file_path, self.backup_path):
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        content = json.load(f)
+                except Exception:
+                    print(f"Error loading {path}")
+                    continue
+
+                # Migration from old list format to new Controller format
+                if "behaviors" in content and isinstance(content["behaviors"], list):
+                    self.migrate_legacy(content["behaviors"])
+                else:
+                    self.data = content
+                    self.data.setdefault("version", 0)
+                    self._generation += 1
+                return
+            print("No readable behaviors file, starting fresh.")
         else:
             self.save()
 
@@ -56,15 +91,107 @@ class BehaviorService:
         self.save()
 
     def save(self):
-        with open(self.file_path, 'w', encoding='utf-8') as f:
-            json.dump(self.data, f, indent=4, ensure_ascii=False)
+        """
+        Persist the config.
+
+        Inside an event loop the write is debounced by `save_delay` seconds,
+        so a burst of mutations costs one write, and runs in a worker thread.
+        Every save bumps the snapshot version and invalidates resolution caches.
+        """
+        self.data["version"] = self.data.get("version", 0) + 1
+        self._generation += 1
+        self._dirty = True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._write(self._snapshot())
+            self._dirty = False
+            return
+
+        if self._save_handle is None:
+            self._save_handle = loop.call_later(self.save_delay, lambda: loop.create_task(self.flush()))
+
+    def _snapshot(self) -> str:
+        # Serialized on the loop thread so the worker thread never sees a half-applied mutation
+        return json.dumps(self.data, indent=4, ensure_ascii=False)
+
+    def _write(self, text: str):
+        """Atomically replace the file, keeping the previous version as a backup"""
+        # A unique temp file, since the bot and API processes may write the same file at once
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(self.file_path)),
+            prefix=f"{os.path.basename(self.file_path)}.",
+            suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+        if os.path.exists(self.file_path):
+            try:
+                if os.path.exists(self.backup_path):
+                    os.remove(self.backup_path)
+                os.link(self.file_path, self.backup_path)
+            except OSError:
+                pass
+        os.replace(tmp_path, self.file_path)
+
+    async def flush(self):
+        """Write pending changes now"""
+        if self._save_handle is not None:
+            self._save_handle.cancel()
+            self._save_handle = None
+        if self._write_lock is None:
+            self._write_lock = asyncio.Lock()
+
+        async with self._write_lock:
+            if not self._dirty:
+                return
+            snapshot = self._snapshot()
+            self._dirty = False
+            try:
+                await asyncio.to_thread(self._write, snapshot)
+            except Exception as e:
+                self._dirty = True
+                print(f"Error saving behaviors: {e}")
 
     def get_full_config(self):
         return self.data
 
+    # --- Sync ---
+    def _record(self, op: str, **args):
+        if self.on_change is not None and not self._replaying:
+            self.on_change(op, args)
+
+    def apply_op(self, op: str, args: Dict):
+        """Replay a mutation made by another process without recording it again"""
+        if op not in self.SYNCED_OPS:
+            print(f"Ignoring unknown behavior op: {op}")
+            return
+        self._replaying = True
+        try:
+            getattr(self, op)(**args)
+        finally:
+            self._replaying = False
+
+    def replace_data(self, data: Dict):
+        """Swap in a full config, e.g. a shared snapshot"""
+        data = dict(data)
+        data["version"] = self.data.get("version", 0)
+        data.setdefault("assignments", {"users": {}, "roles": {}})
+        data.setdefault("personas", {})
+        self.data = data
+        self.save()
+
     # --- Personas ---
     def update_persona(self, id: str, name: str, prompt: str):
         self.data["personas"][id] = {"name": name, "prompt": prompt}
+        self._record("update_persona", id=id, name=name, prompt=prompt)
         self.save()
 
     def delete_persona(self, id: str):
@@ -72,6 +199,7 @@ class BehaviorService:
             del self.data["personas"][id]
             # Cleanup assignments
             # (In a real app, we'd remove refs, but lazy is fine for now)
+            self._record("delete_persona", id=id)
             self.save()
 
     # --- Assignments ---
@@ -81,6 +209,7 @@ class BehaviorService:
                 del self.data["assignments"]["users"][user_id]
         else:
             self.data["assignments"]["users"][user_id] = persona_id
+        self._record("assign_user", user_id=user_id, persona_id=persona_id)
         self.save()
 
     def assign_role(self, role_name: str, persona_id: str):
@@ -89,44 +218,67 @@ class BehaviorService:
                 del self.data["assignments"]["roles"][role_name]
         else:
             self.data["assignments"]["roles"][role_name] = persona_id
+        self._record("assign_role", role_name=role_name, persona_id=persona_id)
         self.save()
         
     def set_default_persona(self, persona_id: str):
         self.data["default_persona"] = persona_id
+        self._record("set_default_persona", persona_id=persona_id)
         self.save()
 
     def set_global_guidelines(self, text: str):
         self.data["global_guidelines"] = text
+        self._record("set_global_guidelines", text=text)
+        self.save()
+
+    def set_role_priority(self, roles: List[str]):
+        """Order in which assigned roles win when a user has several (first wins)"""
+        self.data["role_priority"] = list(roles)
+        self._record("set_role_priority", roles=list(roles))
         self.save()
 
     # --- Resolution ---
-    def resolve_system_instruction(self, user_id: str, user_roles: List[str]) -> str:
-        """Determines the final system prompt for a specific user interaction"""
-        personas = self.data["personas"]
+    def _ensure_index(self):
+        """Compile assignments into lookup tables and drop cached prompts if anything changed"""
+        if self._index_generation == self._generation:
+            return
+
         assignments = self.data["assignments"]
-        
-        # 1. Check User Assignment
-        pid = assignments["users"].get(user_id)
-        
-        # 2. Check Role Assignment
-        if not pid:
-            # Check if any user role matches an assigned role
-            # Priority: defined by order in assignments? Or arbitrary.
-            # We check roles present in 'assignments'
-            for role in user_roles:
-                if role in assignments["roles"]:
-                    pid = assignments["roles"][role]
-                    break
-        
-        # 3. Default
+        self._user_personas = dict(assignments["users"])
+
+        # Explicit priority first, then any other assigned role in assignment order
+        ordered = [role for role in self.data.get("role_priority", []) if role in assignments["roles"]]
+        ordered += [role for role in assignments["roles"] if role not in ordered]
+        self._role_ranks = {role: (rank, assignments["roles"][role]) for rank, role in enumerate(ordered)}
+
+        self._prompts = {}
+        self._resolved.clear()
+        self._index_generation = self._generation
+
+    def _render(self, pid: str) -> str:
+        prompt = self._prompts.get(pid)
+        if prompt is None:
+            persona = self.data["personas"].get(pid, {})
+            guidelines = self.data.get("global_guidelines", "")
+            prompt = self._prompts[pid] = f"{persona.get('prompt', '')}\n\n{guidelines}"
+        return prompt
+
+    def resolve_persona(self, user_id: str, user_roles: List[str]) -> Optional[str]:
+        """Persona id for a user: user assignment, then highest priority role, then default"""
+        self._ensure_index()
+        pid = self._user_personas.get(user_id)
         if not pid:
-            pid = self.data.get("default_persona")
-            
-        # Retrieve Prompt
-        persona = personas.get(pid, {})
-        persona_prompt = persona.get("prompt", "")
-        
-        # Combine with Global Guidelines
-        guidelines = self.data.get("global_guidelines", "")
-        
-        return f"{persona_prompt}\n\n{guidelines}"
+            ranked = [self._role_ranks[role] for role in user_roles if role in self._role_ranks]
+            if ranked:
+                pid = min(ranked)[1]
+        return pid or self.data.get("default_persona")
+
+    def resolve_system_instruction(self, user_id: str, user_roles: List[str]) -> str:
+        """Determines the final system prompt for a specific user interaction"""
+        self._ensure_index()
+        key = (user_id, frozenset(user_roles))
+        prompt = self._resolved.get(key)
+        if prompt is None:
+            prompt = self._render(self.resolve_persona(user_id, user_roles))
+            self._resolved.set(key, prompt)
+        return prompt
@@ -0,0 +1,191 @@
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import DuplicateKeyError, OperationFailure
+from collections import deque
+from datetime import datetime, timezone
+from ..config import config
+import asyncio
+import uuid
+
+SNAPSHOT_ID = "config"
+
+
+class BehaviorSync:
+    """
+    Keeps a BehaviorService in step with every other process through MongoDB.
+
+    Each local mutation is appended to an ops log under the next version number
+    (a unique index makes the version the commit order). Every process replays
+    ops it has not seen yet, so an edit costs one small document, not a full
+    config reload. New ops are noticed through a change stream when the server
+    supports one, and through a cheap indexed version poll otherwise. A snapshot
+    of the whole config is brought up to date as soon as a process has applied
+    new ops, so processes starting up or lagging behind the ops log's TTL never
+    depend on ops that have expired.
+    """
+
+    def __init__(self, behavior_service, poll_interval: float = None):
+        self.behaviors = behavior_service
+        try:
+            self.client = AsyncIOMotorClient(config.MONGO_URI)
+            self.db = self.client.get_database("bella_bot_v2")
+            self.snapshots = self.db.behaviors
+            self.ops = self.db.behavior_ops
+        except Exception as e:
+            print(f"Behavior sync disabled: {e}")
+            self.ops = None
+
+        self.poll_interval = poll_interval or config.BEHAVIOR_POLL_INTERVAL
+        self.origin = uuid.uuid4().hex
+        self.version = 0            # Highest op version reflected in local state
+        self._snapshot_version = 0
+        self._outbox = deque()      # Local ops not yet in the log
+        self._wake = asyncio.Event()
+        self._task = None
+        self._watcher = None
+
+    async def start(self):
+        """Load the shared config and start following changes"""
+        if not config.BEHAVIOR_SYNC or self.ops is None or self._task is not None:
+            return
+        try:
+            await self.ops.create_index("version", unique=True)
+            await self.ops.create_index("created_at", expireAfterSeconds=config.BEHAVIOR_OPS_TTL_DAYS * 86400)
+            await self._load_snapshot()
+        except Exception as e:
+            print(f"Behavior sync disabled: {e}")
+            return
+
+        self.behaviors.on_change = self._queue_op
+        loop = asyncio.get_running_loop()
+        self._task = loop.create_task(self._run())
+        self._watcher = loop.create_task(self._watch())
+
+    async def _load_snapshot(self):
+        # The first process to start seeds the shared config from its local file
+        latest = await self.ops.find_one({}, sort=[("version", -1)], projection={"version": 1})
+        data = {k: v for k, v in self.behaviors.data.items() if k != "version"}
+        await self.snapshots.update_one(
+            {"_id": SNAPSHOT_ID},
+            {"$setOnInsert": {"data": data, "version": latest["version"] if latest else 0}},
+            upsert=True
+        )
+        snapshot = await self.snapshots.find_one({"_id": SNAPSHOT_ID})
+        self.behaviors.replace_data(snapshot["data"])
+        self.version = self._snapshot_version = snapshot["version"]
+        # Local edits made before the snapshot arrived are reapplied on top of it
+        for entry in self._outbox:
+            entry["stale"] = True
+
+    def _queue_op(self, op: str, args: dict):
+        self._outbox.append({"op": op, "args": args, "stale": False})
+        self._wake.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                while self._outbox:
+                    await self._push(self._outbox[0])
+                    self._outbox.popleft()
+                await self._pull()
+                await self._maybe_snapshot()
+            except Exception as e:
+                print(f"Behavior sync error: {e}")
+
+    async def _watch(self):
+        """Wake the sync loop as soon as another process logs an op"""
+        try:
+            async with self.ops.watch([{"$match": {"operationType": "insert"}}]) as stream:
+                async for change in stream:
+                    if change["fullDocument"].get("origin") != self.origin:
+                        self._wake.set()
+        except OperationFailure:
+            # Standalone servers have no change streams; the version poll covers it
+            pass
+        except Exception as e:
+            print(f"Behavior change stream stopped: {e}")
+
+    async def _pull(self):
+        """Replay ops newer than our version, in order; on return there is no gap left"""
+        applied = False
+        while True:
+            gap_at = None
+            cursor = self.ops.find({"version": {"$gt": self.version}}).sort("version", 1)
+            async for doc in cursor:
+                if doc["version"] != self.version + 1:
+                    gap_at = doc["version"]
+                    break
+                self.behaviors.apply_op(doc["op"], doc["args"])
+                self.version = doc["version"]
+                applied = True
+            if gap_at is None:
+                break
+
+            # Ops we never saw have expired from the log; the snapshot covers them
+            await self._load_snapshot()
+            if self.version + 1 < gap_at:
+                # Only if a process died between logging an op and snapshotting it, and
+                # nothing was logged after for a whole TTL. Those ops can't be recovered;
+                # carry on from the oldest op left so new ops never reuse expired versions.
+                print(f"Behavior ops {self.version + 1}-{gap_at - 1} expired before being snapshotted")
+                self.version = gap_at - 1
+
+        if applied:
+            # A remote op may have overwritten a local edit that has not been logged yet
+            for entry in self._outbox:
+                entry["stale"] = True
+
+    async def _push(self, entry: dict):
+        while True:
+            await self._pull()
+            version = self.version + 1
+            try:
+                await self.ops.insert_one({
+                    "version": version,
+                    "op": entry["op"],
+                    "args": entry["args"],
+                    "origin": self.origin,
+                    "created_at": datetime.now(timezone.utc),
+                })
+            except DuplicateKeyError:
+                # Another process took this version; catch up and retry
+                continue
+            if entry["stale"]:
+                self.behaviors.apply_op(entry["op"], entry["args"])
+            self.version = version
+            return
+
+    async def _maybe_snapshot(self):
+        # Every op is snapshotted by whichever process applies it first, well within the ops TTL
+        if self._outbox or self.version <= self._snapshot_version:
+            return
+        data = {k: v for k, v in self.behaviors.data.items() if k != "version"}
+        await self.snapshots.update_one(
+            {"_id": SNAPSHOT_ID, "version": {"$lt": self.version}},
+            {"$set": {"data": data, "version": self.version}}
+        )
+        self._snapshot_version = self.version
+
+    async def close(self):
+        """Stop following changes and log any pending local edits"""
+        for task in (self._watcher, self._task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except (asyncio.CancelledError, Exception):
+                    pass
+        self._task = self._watcher = None
+
+        try:
+            while self._outbox:
+                await self._push(self._outbox[0])
+                self._outbox.popleft()
+            await self._maybe_snapshot()
+        except Exception as e:
+            print(f"Error pushing behavior changes: {e}")
+        self.behaviors.on_change = None
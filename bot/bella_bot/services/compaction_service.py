@@ -0,0 +1,140 @@
+import asyncio
+import re
+from collections import OrderedDict, deque
+from ..cache import TTLCache
+from ..config import config
+from ..text import estimate_tokens
+
+SUMMARY_INSTRUCTION = (
+    "You maintain Bella's long-term memory of Discord users. Each user's notes start with a "
+    "'### USER <id>' line. For every user, merge their existing summary, known facts and recent "
+    "exchanges into one short third-person summary of who they are: names, likes, dislikes, "
+    "relationships and ongoing topics. Drop small talk and anything contradicted by newer "
+    "information. Answer with the same '### USER <id>' line before each user's summary, "
+    "followed by the summary only, as plain sentences."
+)
+_USER_HEADER = re.compile(r"^#+\s*USER\s+(\S+)\s*$", re.MULTILINE)
+
+# Recent exchanges remembered per user for the next compaction
+RECENT_EXCHANGES = 6
+
+
+class CompactionService:
+    """
+    Background worker that folds a user's facts into conversation_summary.
+
+    Users are queued once their fact count or size passes a threshold; the
+    worker summarizes up to COMPACTION_BATCH_SIZE of them in one Gemini call
+    and spaces calls at least COMPACTION_MIN_INTERVAL seconds apart. Summarized
+    facts are pruned, so prompts carry a short fixed-size summary instead of a
+    growing list.
+    """
+
+    def __init__(self, memory_service, ai_service):
+        self.memory = memory_service
+        self.ai = ai_service
+        self.fact_threshold = config.COMPACTION_FACT_THRESHOLD
+        self.token_threshold = config.COMPACTION_TOKEN_THRESHOLD
+        self.batch_size = config.COMPACTION_BATCH_SIZE
+        self.min_interval = config.COMPACTION_MIN_INTERVAL
+        self.summary_tokens = config.COMPACTION_SUMMARY_TOKENS
+
+        self._queue = OrderedDict()  # user_id -> None, insertion ordered and deduplicated
+        self._exchanges = TTLCache(maxsize=config.MEMORY_CACHE_SIZE, ttl=config.MEMORY_CACHE_TTL)
+        self._wake = asyncio.Event()
+        self._worker = None
+
+    def record_exchange(self, user_id: str, message: str, response: str):
+        """Remember a message/reply pair for the user's next summary"""
+        user_id = str(user_id)
+        exchanges = self._exchanges.get(user_id)
+        if exchanges is None:
+            exchanges = deque(maxlen=RECENT_EXCHANGES)
+            self._exchanges.set(user_id, exchanges)
+        exchanges.append((message, response))
+
+    async def maybe_schedule(self, user_id: str):
+        """Queue the user for compaction if their facts have grown past a threshold"""
+        if self.memory.facts is None: return
+        user_id = str(user_id)
+        if user_id in self._queue: return
+
+        facts = await self.memory.facts.get_facts(user_id)
+        size = sum(estimate_tokens(fact["text"]) for fact in facts)
+        if len(facts) < self.fact_threshold and size < self.token_threshold:
+            return
+
+        self._queue[user_id] = None
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+        self._wake.set()
+
+    async def _run(self):
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            while self._queue:
+                batch = []
+                while self._queue and len(batch) < self.batch_size:
+                    batch.append(self._queue.popitem(last=False)[0])
+
+                try:
+                    await self.compact(batch)
+                except Exception as e:
+                    print(f"Error compacting memory for {', '.join(batch)}: {e}")
+                # Rate limit: keep background summaries from eating into the chat quota
+                await asyncio.sleep(self.min_interval)
+
+    async def _notes(self, user_id: str) -> tuple[list, str] | None:
+        """The user's facts and the notes the summary is written from, or None without facts"""
+        facts = list(await self.memory.facts.get_facts(user_id))
+        if not facts: return None
+
+        memory = await self.memory.get_memory(user_id)
+        sections = [f"### USER {user_id}"]
+        if memory.get("summary"):
+            sections.append(f"EXISTING SUMMARY:\n{memory['summary']}")
+        sections.append("KNOWN FACTS:\n" + "\n".join(f"- {fact['text']}" for fact in facts))
+        exchanges = self._exchanges.get(user_id)
+        if exchanges:
+            sections.append("RECENT EXCHANGES:\n" + "\n".join(
+                f"User: {message}\nBella: {response}" for message, response in exchanges
+            ))
+        return facts, "\n\n".join(sections)
+
+    async def compact(self, user_ids: list[str]):
+        """
+        Summarize several users' facts and recent exchanges in one call, then
+        prune the summarized facts. Users missing from the answer keep their
+        facts and are queued again by their next exchange.
+        """
+        facts, notes = {}, []
+        for user_id in map(str, user_ids):
+            found = await self._notes(user_id)
+            if found is not None:
+                facts[user_id], text = found
+                notes.append(text)
+        if not notes: return
+
+        answer = await self.ai.summarize("\n\n".join(notes), SUMMARY_INSTRUCTION, self.summary_tokens * len(notes))
+        if not answer: return
+
+        # re.split with a group gives [preamble, id, summary, id, summary, ...]
+        parts = _USER_HEADER.split(answer)
+        for user_id, summary in zip(parts[1::2], parts[2::2]):
+            # Hard cap in case the model ignores max_output_tokens
+            summary = summary.strip()[:self.summary_tokens * 4]
+            if user_id not in facts or not summary:
+                continue
+            await self.memory.set_summary(user_id, summary)
+            await self.memory.facts.delete(user_id, [fact["_id"] for fact in facts.pop(user_id)])
+            self._exchanges.pop(user_id)
+
+    async def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
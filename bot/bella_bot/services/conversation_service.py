@@ -0,0 +1,100 @@
+from collections import OrderedDict, deque
+from ..config import config
+from ..text import estimate_tokens
+
+
+class Turn:
+    """One message in a channel's history"""
+    __slots__ = ("role", "content", "tokens", "message_id")
+
+    def __init__(self, role: str, content: str, message_id: int = None):
+        self.role = role  # "user" or "model", as Gemini expects
+        self.content = content
+        self.tokens = estimate_tokens(content)
+        self.message_id = message_id
+
+
+class ConversationService:
+    """
+    In-memory rolling history of recent turns per channel or thread.
+
+    Each channel keeps at most CONVERSATION_MAX_TURNS turns within
+    CONVERSATION_TOKEN_BUDGET tokens. Across channels the total stays under
+    CONVERSATION_GLOBAL_TOKENS by evicting the least recently used channel.
+    """
+
+    def __init__(self, max_turns: int = None, token_budget: int = None, global_tokens: int = None):
+        self.max_turns = max_turns or config.CONVERSATION_MAX_TURNS
+        self.token_budget = token_budget or config.CONVERSATION_TOKEN_BUDGET
+        self.global_tokens = global_tokens or config.CONVERSATION_GLOBAL_TOKENS
+        self._channels = OrderedDict()  # channel_id -> deque[Turn], least recently used first
+        self._tokens = {}               # channel_id -> tokens held by that channel
+        self._total_tokens = 0
+
+    def add(self, channel_id: int, role: str, content: str, message_id: int = None):
+        """Append a turn to a channel's history"""
+        content = content.strip()
+        if not content:
+            return
+
+        turns = self._channels.get(channel_id)
+        if turns is None:
+            turns = self._channels[channel_id] = deque()
+            self._tokens[channel_id] = 0
+        self._channels.move_to_end(channel_id)
+
+        turn = Turn(role, content, message_id)
+        turns.append(turn)
+        self._tokens[channel_id] += turn.tokens
+        self._total_tokens += turn.tokens
+
+        while turns and (len(turns) > self.max_turns or self._tokens[channel_id] > self.token_budget):
+            self._drop(channel_id, turns.popleft())
+
+        while self._total_tokens > self.global_tokens and len(self._channels) > 1:
+            self.forget(next(iter(self._channels)))
+
+    def _drop(self, channel_id: int, turn: Turn):
+        self._tokens[channel_id] -= turn.tokens
+        self._total_tokens -= turn.tokens
+
+    def forget(self, channel_id: int):
+        """Drop a channel's history"""
+        turns = self._channels.pop(channel_id, None)
+        if turns is None:
+            return
+        self._total_tokens -= self._tokens.pop(channel_id)
+
+    def history(self, channel_id: int, reply_to: Turn = None, token_budget: int = None) -> list[dict]:
+        """
+        Most recent turns of a channel, oldest first, within the token budget.
+
+        `reply_to` is the message being replied to; it is included first when it
+        has already scrolled out of the buffer.
+        """
+        budget = token_budget or self.token_budget
+        turns = self._channels.get(channel_id) or ()
+        if turns:
+            self._channels.move_to_end(channel_id)
+
+        selected = []
+        used = 0
+        for turn in reversed(turns):
+            if used + turn.tokens > budget:
+                break
+            selected.append(turn)
+            used += turn.tokens
+        selected.reverse()
+
+        # Bella's own replies are stored without a message id, so compare content as well
+        if reply_to is not None and not any(
+            turn.message_id == reply_to.message_id or turn.content == reply_to.content for turn in selected
+        ):
+            if used + reply_to.tokens > budget:
+                # Keep the replied-to message, it matters more than the oldest turns
+                while selected and used + reply_to.tokens > budget:
+                    used -= selected.pop(0).tokens
+            if used + reply_to.tokens <= budget:
+                selected.insert(0, reply_to)
+
+        return [{"role": turn.role, "content": turn.content} for turn in selected]
@@ -0,0 +1,82 @@
+import asyncio
+import httpx
+from ..batching import drain, next_batch
+from ..config import config
+
+
+class EventPublisher:
+    """
+    Sends dashboard events to the API process.
+
+    Events go into a bounded queue and are POSTed to /events as JSON arrays
+    over one keep-alive client. When the queue is full new events are
+    dropped and counted; the counters ride along as a `publisher_stats`
+    event whenever they change.
+    """
+
+    def __init__(self, url: str = None):
+        self.url = url or config.EVENTS_URL
+        self._queue = asyncio.Queue(maxsize=config.EVENT_QUEUE_SIZE)
+        self._batch_size = config.EVENT_BATCH_SIZE
+        self._flush_interval = config.EVENT_FLUSH_INTERVAL
+        self._client = None
+        self._sender = None
+        self._stopping = asyncio.Event()
+        self.stats = {"sent": 0, "dropped": 0, "failed": 0}
+        self._reported = dict(self.stats)
+
+    def publish(self, event: dict):
+        """Queue an event; never waits and never raises"""
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            return
+
+        if self._sender is None or self._sender.done():
+            self._sender = asyncio.get_running_loop().create_task(self._send_loop())
+
+    async def _send_loop(self):
+        while not self._stopping.is_set():
+            batch = await next_batch(self._queue, self._batch_size, self._flush_interval, self._stopping)
+            if batch:
+                await self._post(batch)
+
+    async def _post(self, batch: list[dict]):
+        if self.stats["dropped"] != self._reported["dropped"] or self.stats["failed"] != self._reported["failed"]:
+            self._reported = dict(self.stats)
+            batch = batch + [{"type": "publisher_stats", "payload": dict(self.stats)}]
+
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=5,
+                limits=httpx.Limits(max_connections=2, max_keepalive_connections=2)
+            )
+        try:
+            resp = await self._client.post(self.url, json=batch)
+            resp.raise_for_status()
+            self.stats["sent"] += len(batch)
+        except Exception:
+            # Don't let dashboard failures affect bot behavior
+            self.stats["failed"] += len(batch)
+
+    async def close(self):
+        """Stop the sender, flush queued events and close the connection"""
+        if self._sender is not None:
+            # Let the sender post what it has already taken off the queue
+            self._stopping.set()
+            await self._sender
+            self._sender = None
+            self._stopping.clear()
+
+        pending = drain(self._queue)
+        for i in range(0, len(pending), self._batch_size):
+            await self._post(pending[i:i + self._batch_size])
+
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+# One queue, sender and connection per process, shared by everything that publishes
+event_publisher = EventPublisher()
@@ -0,0 +1,143 @@
+import math
+import time
+from collections import Counter
+from ..cache import TTLCache
+from ..config import config
+from ..text import estimate_tokens, tokenize
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+
+
+def jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 1.0 if a == b else 0.0
+    return len(a & b) / len(a | b)
+
+
+def bm25_scores(query: list[str], documents: list[list[str]]) -> list[float]:
+    """Score each tokenized document against the query terms"""
+    if not documents:
+        return []
+
+    n = len(documents)
+    avg_len = sum(len(doc) for doc in documents) / n or 1.0
+    doc_freq = Counter(term for doc in documents for term in set(doc))
+    query_terms = set(query)
+
+    scores = []
+    for doc in documents:
+        counts = Counter(doc)
+        score = 0.0
+        for term in query_terms:
+            tf = counts.get(term)
+            if not tf:
+                continue
+            idf = math.log(1 + (n - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5))
+            score += idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * len(doc) / avg_len))
+        scores.append(score)
+    return scores
+
+
+class FactStore:
+    """
+    User facts kept in their own indexed collection.
+
+    Near-duplicates are dropped on insert, each user keeps at most
+    FACT_MAX_PER_USER facts (oldest evicted first), and prompts only get the
+    facts most relevant to the current message, ranked with BM25.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.max_per_user = config.FACT_MAX_PER_USER
+        self.duplicate_threshold = config.FACT_DUPLICATE_THRESHOLD
+        # user_id -> facts ordered oldest first, each {"_id", "text", "created_at", "terms"}
+        self._cache = TTLCache(maxsize=config.MEMORY_CACHE_SIZE, ttl=config.MEMORY_CACHE_TTL)
+        self._indexed = False
+
+    async def _ensure_indexes(self):
+        if self._indexed: return
+        self._indexed = True
+        try:
+            await self.collection.create_index([("user_id", 1), ("created_at", 1)])
+        except Exception as e:
+            print(f"Failed to create fact indexes: {e}")
+
+    async def get_facts(self, user_id: str) -> list[dict]:
+        """All facts of a user, oldest first"""
+        user_id = str(user_id)
+        facts = self._cache.get(user_id)
+        if facts is not None:
+            return facts
+
+        await self._ensure_indexes()
+        cursor = self.collection.find(
+            {"user_id": user_id},
+            {"text": 1, "created_at": 1}
+        ).sort("created_at", 1)
+        facts = await cursor.to_list(length=None)
+        for fact in facts:
+            fact["terms"] = tokenize(fact["text"])
+
+        self._cache.set(user_id, facts)
+        return facts
+
+    async def add(self, user_id: str, text: str) -> bool:
+        """Store a fact unless the user already has a near-duplicate of it"""
+        user_id = str(user_id)
+        text = text.strip()
+        if not text:
+            return False
+
+        facts = await self.get_facts(user_id)
+        terms = tokenize(text)
+        term_set = set(terms)
+        for fact in facts:
+            if jaccard(term_set, set(fact["terms"])) >= self.duplicate_threshold:
+                return False
+
+        doc = {"user_id": user_id, "text": text, "created_at": time.time()}
+        result = await self.collection.insert_one(doc)
+        facts.append({"_id": result.inserted_id, "text": text, "created_at": doc["created_at"], "terms": terms})
+
+        excess = len(facts) - self.max_per_user
+        if excess > 0:
+            await self.delete(user_id, [fact["_id"] for fact in facts[:excess]])
+        return True
+
+    async def delete(self, user_id: str, fact_ids: list):
+        """Remove facts by _id"""
+        if not fact_ids: return
+        await self.collection.delete_many({"_id": {"$in": fact_ids}})
+
+        facts = self._cache.get(str(user_id))
+        if facts is not None:
+            removed = set(fact_ids)
+            facts[:] = [fact for fact in facts if fact["_id"] not in removed]
+
+    async def relevant(self, user_id: str, query: str, top_k: int = None, token_budget: int = None) -> list[str]:
+        """The facts most relevant to `query`, best first, within a token budget"""
+        top_k = top_k or config.FACT_TOP_K
+        token_budget = token_budget or config.FACT_TOKEN_BUDGET
+
+        facts = await self.get_facts(user_id)
+        if not facts:
+            return []
+
+        scores = bm25_scores(tokenize(query), [fact["terms"] for fact in facts])
+        # Without any overlap, fall back to the most recent facts
+        ranked = sorted(zip(scores, facts), key=lambda item: (item[0], item[1]["created_at"]), reverse=True)
+
+        selected = []
+        used = 0
+        for _, fact in ranked:
+            cost = estimate_tokens(fact["text"])
+            if used + cost > token_budget:
+                continue
+            selected.append(fact["text"])
+            used += cost
+            if len(selected) >= top_k:
+                break
+        return selected
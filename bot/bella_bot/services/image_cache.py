@@ -0,0 +1,202 @@
+from collections import OrderedDict
+from ..config import config
+import asyncio
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+
+# Magic bytes -> (file extension, media type)
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", ".jpg", "image/jpeg"),
+    (b"\x89PNG", ".png", "image/png"),
+    (b"RIFF", ".webp", "image/webp"),
+    (b"GIF8", ".gif", "image/gif"),
+)
+MEDIA_TYPES = {ext: media_type for _, ext, media_type in IMAGE_SIGNATURES}
+KEY_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+def cache_key(prompt: str, model: str, width: int, height: int, seed: int = None, enhance: bool = False) -> str:
+    """Content address of an image request; whitespace and case differences in the prompt don't matter"""
+    normalized = {
+        "prompt": " ".join(prompt.split()).casefold(),
+        "model": model,
+        "width": int(width),
+        "height": int(height),
+        "seed": seed,
+        "enhance": bool(enhance),
+    }
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def sniff_extension(data: bytes) -> str:
+    for magic, ext, _ in IMAGE_SIGNATURES:
+        if data.startswith(magic):
+            return ext
+    return ".bin"
+
+
+class ImageCache:
+    """
+    Size-bounded LRU of generated images on disk, one file per cache key.
+
+    Several processes (bot, API, workers) may share the directory. Images another
+    process stored are found on disk on a miss, and the index is rebuilt from the
+    directory every RESCAN_INTERVAL seconds on writes, so the size limit and LRU
+    order (file modification times, refreshed on hits) cover every process's files.
+    """
+
+    RESCAN_INTERVAL = 60
+
+    _shared = {}
+
+    def __init__(self, directory: str = None, max_bytes: int = None):
+        self.directory = directory or config.IMAGE_CACHE_DIR
+        self.max_bytes = max_bytes or config.IMAGE_CACHE_MAX_MB * 1024 * 1024
+        self.stats = {"hits": 0, "misses": 0, "evicted": 0}
+        os.makedirs(self.directory, exist_ok=True)
+        # key -> (path, size), least recently used first
+        self._entries, self.total_bytes = self._scan(self.directory)
+        self._scanned = time.monotonic()
+
+    @classmethod
+    def shared(cls, directory: str = None) -> "ImageCache":
+        """One cache per directory, so services in the same process agree on the LRU order"""
+        directory = directory or config.IMAGE_CACHE_DIR
+        if directory not in cls._shared:
+            cls._shared[directory] = cls(directory)
+        return cls._shared[directory]
+
+    @staticmethod
+    def _scan(directory: str) -> tuple[OrderedDict, int]:
+        """Index every cached file, least recently used first by modification time"""
+        found = []
+        for root, _, files in os.walk(directory):
+            for name in files:
+                key, ext = os.path.splitext(name)
+                if not KEY_PATTERN.match(key) or ext == ".tmp":
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                found.append((st.st_mtime, key, path, st.st_size))
+        entries = OrderedDict()
+        for _, key, path, size in sorted(found):
+            entries[key] = (path, size)
+        return entries, sum(size for _, size in entries.values())
+
+    def _find(self, key: str) -> tuple[str, int] | None:
+        """Look for an image stored by another process after our index was built"""
+        try:
+            with os.scandir(os.path.join(self.directory, key[:2])) as it:
+                for item in it:
+                    name, ext = os.path.splitext(item.name)
+                    if name == key and ext != ".tmp":
+                        return item.path, item.stat().st_size
+        except OSError:
+            pass
+        return None
+
+    def _adopt(self, key: str, found: tuple[str, int] | None) -> tuple[str, int] | None:
+        if found is not None and key not in self._entries:
+            self._entries[key] = found
+            self.total_bytes += found[1]
+        return self._entries.get(key)
+
+    def path(self, key: str) -> str | None:
+        """Path of a cached image, or None"""
+        entry = self._entries.get(key) or self._adopt(key, self._find(key))
+        if entry is None:
+            return None
+        if not os.path.exists(entry[0]):
+            self._forget(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    @staticmethod
+    def media_type(path: str) -> str:
+        return MEDIA_TYPES.get(os.path.splitext(path)[1], "application/octet-stream")
+
+    async def get(self, key: str) -> bytes | None:
+        entry = self._entries.get(key) or self._adopt(key, await asyncio.to_thread(self._find, key))
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        try:
+            data = await asyncio.to_thread(self._read, entry[0])
+        except OSError:
+            # Evicted by another process sharing the directory
+            self._forget(key)
+            self.stats["misses"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return data
+
+    @staticmethod
+    def _read(path: str) -> bytes:
+        with open(path, "rb") as f:
+            data = f.read()
+        os.utime(path)
+        return data
+
+    async def put(self, key: str, data: bytes) -> str:
+        """Store an image and evict least recently used ones past the size limit"""
+        path = os.path.join(self.directory, key[:2], key + sniff_extension(data))
+        await asyncio.to_thread(self._write, path, data)
+        if time.monotonic() - self._scanned > self.RESCAN_INTERVAL:
+            # Pick up what other processes stored and evicted, so the limit holds for the directory
+            self._entries, self.total_bytes = await asyncio.to_thread(self._scan, self.directory)
+            self._scanned = time.monotonic()
+        if key in self._entries:
+            self._forget(key)
+        self._entries[key] = (path, len(data))
+        self.total_bytes += len(data)
+
+        victims = []
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            old_key = next(iter(self._entries))
+            victims.append(self._entries[old_key][0])
+            self._forget(old_key)
+            self.stats["evicted"] += 1
+        if victims:
+            await asyncio.to_thread(self._remove, victims)
+        return path
+
+    @staticmethod
+    def _write(path: str, data: bytes):
+        directory, name = os.path.split(path)
+        os.makedirs(directory, exist_ok=True)
+        # A unique temp file, since processes sharing the directory may store the same key at once
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f"{name}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    @staticmethod
+    def _remove(paths: list[str]):
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _forget(self, key: str):
+        _, size = self._entries.pop(key)
+        self.total_bytes -= size
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "entries": len(self._entries), "bytes": self.total_bytes, "max_bytes": self.max_bytes}
@@ -1,18 +1,90 @@
+import asyncio
 import httpx
+import time
 import urllib.parse
+from collections import deque
 from typing import Literal
+from ..config import config
+from .image_cache import ImageCache, cache_key, sniff_extension
 
 ImageModel = Literal["flux", "turbo", "stable-diffusion"]
 
+
+class ModelStats:
+    """Rolling latency and error rate of one upstream model over its last `window` requests"""
+
+    def __init__(self, window: int = None):
+        window = window or config.IMAGE_STATS_WINDOW
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)  # True for errors
+
+    def record(self, latency: float, error: bool = False):
+        self.outcomes.append(error)
+        if not error:
+            self.latencies.append(latency)
+
+    def percentile(self, p: float) -> float | None:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+    @property
+    def error_rate(self) -> float:
+        return sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0
+
+    def snapshot(self) -> dict:
+        p50, p95 = self.percentile(50), self.percentile(95)
+        return {
+            "samples": len(self.latencies),
+            "p50": round(p50, 3) if p50 is not None else None,
+            "p95": round(p95, 3) if p95 is not None else None,
+            "error_rate": round(self.error_rate, 3),
+        }
+
+
 class ImageService:
     """Image generation service using Pollinations.ai API"""
     
     BASE_URL = "https://image.pollinations.ai/prompt"
     AVAILABLE_MODELS = ["flux", "turbo", "stable-diffusion"]
+    # Hedge target while no model has enough samples to compare
+    FAST_MODEL = "turbo"
+    # Shared by every ImageService in the process, so all of them learn from each request
+    MODEL_STATS = {}
     
-    def __init__(self, default_model: str = "flux", auth_token: str = None):
+    def __init__(self, default_model: str = "flux", auth_token: str = None, cache: ImageCache = None):
         self.default_model = default_model if default_model in self.AVAILABLE_MODELS else "flux"
         self.auth_token = auth_token
+        self.cache = cache if cache is not None else ImageCache.shared()
+        self._client = None
+        # cache key -> upstream download shared by every concurrent identical request
+        self._inflight = {}
+        self.stats = {"upstream": 0, "coalesced": 0, "hedged": 0, "hedge_wins": 0}
+        self.on_stats = None  # Called with get_hedging_stats() after every upstream download
+        for model in self.AVAILABLE_MODELS:
+            self.MODEL_STATS.setdefault(model, ModelStats())
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """One pooled client per service, so repeat requests reuse connections"""
+        if self._client is None or self._client.is_closed:
+            headers = {}
+            if self.auth_token:
+                headers["Authorization"] = f"Bearer {self.auth_token}"
+            self._client = httpx.AsyncClient(
+                timeout=60.0,
+                headers=headers,
+                limits=httpx.Limits(
+                    max_connections=config.IMAGE_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=config.IMAGE_HTTP_MAX_CONNECTIONS
+                )
+            )
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
     
     def set_model(self, model: str) -> bool:
         """Set the default model for image generation"""
@@ -24,6 +96,36 @@ class ImageService:
     def get_current_model(self) -> str:
         """Get the currently selected model"""
         return self.default_model
+
+    def get_model_stats(self) -> dict:
+        """Rolling p50/p95 latency (seconds) and error rate per model"""
+        return {model: self.MODEL_STATS[model].snapshot() for model in self.AVAILABLE_MODELS}
+
+    def get_hedging_stats(self) -> dict:
+        """Per-model latency plus how often requests were hedged and the hedge won"""
+        return {"models": self.get_model_stats(), "hedged": self.stats["hedged"], "hedge_wins": self.stats["hedge_wins"]}
+
+    def _hedge_delay(self, model: str) -> float:
+        """How long to wait on a model before hedging: its tail latency, bounded by the SLO"""
+        threshold = None
+        stats = self.MODEL_STATS[model]
+        if len(stats.latencies) >= config.IMAGE_HEDGE_MIN_SAMPLES:
+            threshold = stats.percentile(config.IMAGE_HEDGE_PERCENTILE)
+        if threshold is None:
+            return config.IMAGE_SLO_SECONDS
+        return min(max(threshold, config.IMAGE_HEDGE_MIN_DELAY), config.IMAGE_SLO_SECONDS)
+
+    def _hedge_model(self, model: str) -> str | None:
+        """Healthy model with the lowest median latency, other than `model`"""
+        candidates = []
+        for other in self.AVAILABLE_MODELS:
+            stats = self.MODEL_STATS[other]
+            if other == model or len(stats.latencies) < config.IMAGE_HEDGE_MIN_SAMPLES or stats.error_rate > 0.5:
+                continue
+            candidates.append((stats.percentile(50), other))
+        if candidates:
+            return min(candidates)[1]
+        return self.FAST_MODEL if model != self.FAST_MODEL else None
     
     async def generate_image(
         self, 
@@ -82,28 +184,153 @@ class ImageService:
         prompt: str, 
         model: str = None,
         width: int = 1024,
-        height: int = 1024
+        height: int = 1024,
+        seed: int = None,
+        enhance: bool = False
     ) -> bytes:
         """
         Generate an image and return the raw bytes
         
+        Identical requests are answered from the on-disk cache.
+        
         Args:
             prompt: Text description of the image
             model: Model to use (flux, turbo, stable-diffusion)
             width: Image width
             height: Image height
+            seed: Random seed for reproducibility
+            enhance: Enhance prompt automatically
         
         Returns:
             Image data as bytes
         """
-        url = await self.generate_image(prompt, model, width, height)
-        
-        # Prepare headers with authentication if token exists
-        headers = {}
-        if self.auth_token:
-            headers["Authorization"] = f"Bearer {self.auth_token}"
+        data, _ = await self.fetch_image(prompt, model, width, height, seed, enhance)
+        return data
+
+    async def fetch_image(
+        self,
+        prompt: str,
+        model: str = None,
+        width: int = 1024,
+        height: int = 1024,
+        seed: int = None,
+        enhance: bool = False
+    ) -> tuple[bytes, str]:
+        """
+        Like generate_image_bytes, also returning the cache key (see /api/image/cache/{key}).
         
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.get(url, headers=headers)
+        The key names the model that actually produced the image, which can
+        differ from `model` when a hedged request won; the image is cached under
+        that key only, so asking for `model` again never returns another model's output.
+        """
+        if model is None or model not in self.AVAILABLE_MODELS:
+            model = self.default_model
+        key = cache_key(prompt, model, width, height, seed, enhance)
+
+        data = await self.cache.get(key)
+        if data is not None:
+            return data, key
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(
+                self._download(prompt, model, width, height, seed, enhance)
+            )
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._download_done(key, t))
+        else:
+            self.stats["coalesced"] += 1
+        # Shielded so one caller giving up doesn't cancel the download for the others
+        return await asyncio.shield(task)
+
+    def _download_done(self, key: str, task: asyncio.Task):
+        self._inflight.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # Mark as retrieved even if every waiter went away
+
+    async def _download(self, prompt: str, model: str, width: int, height: int, seed: int, enhance: bool) -> tuple[bytes, str]:
+        """Fetch from upstream and cache the image under the key of the model that produced it"""
+        self.stats["upstream"] += 1
+        try:
+            data, key, cached = await self._hedged_get(prompt, model, width, height, seed, enhance)
+        finally:
+            if self.on_stats is not None:
+                self.on_stats(self.get_hedging_stats())
+        if not cached:
+            try:
+                await self.cache.put(key, data)
+            except OSError as e:
+                print(f"Failed to cache image: {e}")
+        return data, key
+
+    async def _hedged_get(self, prompt: str, model: str, width: int, height: int, seed: int, enhance: bool) -> tuple[bytes, str, bool]:
+        """
+        Fetch an image, hedging with a faster model when this one is slow.
+
+        If the model hasn't answered within its hedge delay, or fails outright,
+        the same request goes to the hedge model as well and the first image wins.
+        Returns the image, the cache key of the model that produced it and
+        whether it came from the cache (a hedge model's earlier image for the
+        same request is reused instead of being generated again).
+        """
+        request = (prompt, width, height, seed, enhance)
+        primary = asyncio.create_task(self._timed_get(model, *request))
+        if not config.IMAGE_HEDGING:
+            return await primary
+
+        done, _ = await asyncio.wait({primary}, timeout=self._hedge_delay(model))
+        if done and primary.exception() is None:
+            return primary.result()
+
+        hedge_model = self._hedge_model(model)
+        if hedge_model is None:
+            return await primary
+        self.stats["hedged"] += 1
+        pending = {primary, asyncio.create_task(self._cached_get(hedge_model, *request))}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.stats["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _cached_get(self, model: str, prompt: str, width: int, height: int, seed: int, enhance: bool) -> tuple[bytes, str, bool]:
+        key = cache_key(prompt, model, width, height, seed, enhance)
+        data = await self.cache.get(key)
+        if data is not None:
+            return data, key, True
+        return await self._timed_get(model, prompt, width, height, seed, enhance)
+
+    async def _timed_get(self, model: str, prompt: str, width: int, height: int, seed: int, enhance: bool) -> tuple[bytes, str, bool]:
+        stats = self.MODEL_STATS[model]
+        started = time.monotonic()
+        try:
+            url = await self.generate_image(prompt, model, width, height, seed=seed, enhance=enhance)
+            response = await self._get_client().get(url)
             response.raise_for_status()
-            return response.content
\ No newline at end of file
+        except asyncio.CancelledError:
+            # Lost a hedge race: we only know it would have taken longer, so it isn't a sample
+            raise
+        except Exception:
+            stats.record(time.monotonic() - started, error=True)
+            raise
+        stats.record(time.monotonic() - started)
+        return response.content, cache_key(prompt, model, width, height, seed, enhance), False
+
+    @staticmethod
+    def attachment_name(key: str, data: bytes) -> str:
+        """Filename for uploading an image, referenced in embeds as attachment://<name>"""
+        return f"{key[:16]}{sniff_extension(data)}"
+
+
+# Shared by everything in the process, so identical in-flight requests are merged and
+# all of them use one connection pool
+image_service = ImageService(default_model=config.IMAGE_MODEL, auth_token=config.POLLINATIONS_TOKEN)
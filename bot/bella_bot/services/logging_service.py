@@ -1,4 +1,8 @@
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import BulkWriteError
+from bson import ObjectId
+from datetime import datetime, timezone
+from ..batching import drain, next_batch
 from ..config import config
 import time
 import asyncio
@@ -9,46 +13,171 @@ class LoggingService:
             self.client = AsyncIOMotorClient(config.MONGO_URI)
             self.db = self.client.get_database("bella_bot_v2")
             self.logs = self.db.logs
-            # Create TTL index for logs to expire after 7 days
-            # We run this in a task to avoid blocking init
-            pass 
         except Exception:
             self.logs = None
 
+        # Entries are queued here and written in batches by a background task
+        self._queue = asyncio.Queue(maxsize=config.LOG_QUEUE_SIZE)
+        self._batch_size = config.LOG_BATCH_SIZE
+        self._flush_interval = config.LOG_FLUSH_INTERVAL
+        self._flusher = None
+        self._stopping = asyncio.Event()
+        self.stats = {"queued": 0, "written": 0, "dropped": 0, "failed": 0}
+
+    async def start(self):
+        """Ensure indexes and start the background writer"""
+        if self.logs is None: return
+        try:
+            # TTL indexes only work on dates, so entries carry created_at next to the float timestamp
+            await self.logs.create_index("created_at", expireAfterSeconds=config.LOG_TTL_DAYS * 86400)
+            # Compound indexes matching get_logs' filters and its (timestamp, _id) keyset sort
+            await self.logs.create_index([("timestamp", -1), ("_id", -1)])
+            await self.logs.create_index([("level", 1), ("timestamp", -1), ("_id", -1)])
+            await self.logs.create_index([("type", 1), ("timestamp", -1), ("_id", -1)])
+        except Exception as e:
+            print(f"Failed to create log indexes: {e}")
+        self._ensure_flusher()
+
+    def _ensure_flusher(self):
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.get_running_loop().create_task(self._flush_loop())
+
     async def log_event(self, type: str, message: str, level: str = "INFO", details: dict = None):
-        """Log an event"""
+        """Queue an event for the background writer"""
         if self.logs is None: return
         
         entry = {
             "timestamp": time.time(),
+            "created_at": datetime.now(timezone.utc),
             "type": type, # e.g. "command", "error", "message", "system"
             "message": message,
             "level": level, # "INFO", "WARN", "ERROR"
             "details": details or {}
         }
         try:
-            await self.logs.insert_one(entry)
+            self._queue.put_nowait(entry)
+        except asyncio.QueueFull:
+            # Mongo is falling behind: apply a little backpressure, then shed load
+            try:
+                await asyncio.wait_for(self._queue.put(entry), config.LOG_ENQUEUE_TIMEOUT)
+            except asyncio.TimeoutError:
+                self.stats["dropped"] += 1
+                return
+        self.stats["queued"] += 1
+        self._ensure_flusher()
+
+    async def _flush_loop(self):
+        while not self._stopping.is_set():
+            batch = await next_batch(self._queue, self._batch_size, self._flush_interval, self._stopping)
+            if batch:
+                await self._write(batch)
+
+    async def _write(self, batch: list[dict]):
+        try:
+            await self.logs.insert_many(batch, ordered=False)
+            self.stats["written"] += len(batch)
+        except BulkWriteError as e:
+            inserted = e.details.get("nInserted", 0)
+            self.stats["written"] += inserted
+            self.stats["failed"] += len(batch) - inserted
         except Exception as e:
-            print(f"Failed to write log: {e}")
+            self.stats["failed"] += len(batch)
+            print(f"Failed to write logs: {e}")
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "pending": self._queue.qsize()}
+
+    async def close(self):
+        """Stop the writer and flush everything still queued"""
+        if self._flusher is not None:
+            # Let the writer finish its current batch; cancelling it would lose the entries it holds
+            self._stopping.set()
+            await self._flusher
+            self._flusher = None
+            self._stopping.clear()
+
+        if self.logs is None: return
+        pending = drain(self._queue)
+        for i in range(0, len(pending), self._batch_size):
+            await self._write(pending[i:i + self._batch_size])
         
-    async def get_logs(self, limit: int = 100, level: str = None):
-        """Get recent logs"""
-        if self.logs is None: return []
+    @staticmethod
+    def _encode_cursor(log: dict) -> str:
+        return f"{log['timestamp']}_{log['_id']}"
+
+    @staticmethod
+    def _decode_cursor(cursor: str) -> tuple[float, ObjectId]:
+        timestamp, _, oid = cursor.partition("_")
+        return float(timestamp), ObjectId(oid)
+
+    async def get_logs(
+        self,
+        limit: int = 100,
+        level: str = None,
+        type: str = None,
+        since: float = None,
+        until: float = None,
+        before: str = None,
+        fields: list[str] = None,
+        with_count: bool = False
+    ) -> dict:
+        """
+        Get a page of logs, newest first.
+
+        Pages are keyset-paginated on (timestamp, _id): pass the returned
+        `next_cursor` as `before` to fetch the next page, which costs the same
+        no matter how deep it is. `fields` limits the returned fields and
+        `with_count` adds the total number of matching logs.
+        """
+        empty = {"logs": [], "next_cursor": None}
+        if self.logs is None: return empty
         
         query = {}
         if level and level != "ALL":
             query["level"] = level
+        if type and type != "ALL":
+            query["type"] = type
+        time_range = {}
+        if since is not None:
+            time_range["$gte"] = since
+        if until is not None:
+            time_range["$lt"] = until
+        if time_range:
+            query["timestamp"] = time_range
+
+        page_query = dict(query)
+        if before:
+            try:
+                before_ts, before_id = self._decode_cursor(before)
+            except Exception:
+                raise ValueError("Invalid cursor")
+            page_query["$or"] = [
+                {"timestamp": {"$lt": before_ts}},
+                {"timestamp": before_ts, "_id": {"$lt": before_id}},
+            ]
+
+        projection = {"created_at": 0}
+        if fields:
+            # The cursor needs timestamp and _id, which is always returned
+            projection = {field: 1 for field in fields}
+            projection["timestamp"] = 1
             
         try:
-            # Sort by timestamp descending
-            cursor = self.logs.find(query).sort("timestamp", -1).limit(limit)
+            cursor = self.logs.find(page_query, projection).sort([("timestamp", -1), ("_id", -1)]).limit(limit)
             logs = await cursor.to_list(length=limit)
+
+            result = {
+                "logs": logs,
+                "next_cursor": self._encode_cursor(logs[-1]) if len(logs) == limit else None
+            }
+            if with_count:
+                result["total"] = await self.logs.count_documents(query)
             
             # Convert _id to string for JSON serialization
             for log in logs:
                 log["_id"] = str(log["_id"])
             
-            return logs
+            return result
         except Exception as e:
             print(f"Failed to fetch logs: {e}")
-            return []
+            return empty
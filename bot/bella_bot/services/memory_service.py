@@ -1,8 +1,16 @@
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
+from ..cache import TTLCache
 from ..config import config
+from .fact_store import FactStore
 import time
 import asyncio
 
+# Fields needed to build a user's memory, so reads skip everything else in the document.
+# "facts" is only read to migrate documents from before facts had their own collection.
+MEMORY_PROJECTION = {"_id": 0, "facts": 1, "roles": 1, "conversation_summary": 1}
+
+
 class MemoryService:
     def __init__(self):
         # Use motor for async MongoDB
@@ -10,52 +18,178 @@ class MemoryService:
             self.client = AsyncIOMotorClient(config.MONGO_URI)
             self.db = self.client.get_database("bella_bot_v2")
             self.users = self.db.users
+            self.facts = FactStore(self.db.facts)
         except Exception as e:
             print(f"Failed to connect to MongoDB: {e}")
             self.users = None
+            self.facts = None
+
+        # user_id -> memory dict, as returned by get_memory
+        self._cache = TTLCache(maxsize=config.MEMORY_CACHE_SIZE, ttl=config.MEMORY_CACHE_TTL)
+
+        # Write-behind buffer: user_id -> (username, roles, last_seen), latest state wins
+        self._pending = {}
+        self._flush_interval = config.MEMORY_FLUSH_INTERVAL
+        self._flush_size = config.MEMORY_FLUSH_SIZE
+        self._flush_requested = asyncio.Event()
+        self._flusher = None
+        self._closing = False
+
+    @staticmethod
+    def _interaction_update(username: str, roles: list[str], last_seen: float = None) -> dict:
+        return {
+            "$set": {
+                "username": username,
+                "roles": roles,
+                "last_seen": last_seen or time.time()
+            },
+            "$setOnInsert": {
+                "conversation_summary": "",
+                "created_at": time.time()
+            }
+        }
+
+    @staticmethod
+    def _to_memory(user: dict) -> dict:
+        if not user:
+            return {"roles": [], "summary": ""}
+        return {
+            "roles": user.get("roles", []),
+            "summary": user.get("conversation_summary", "")
+        }
+
+    async def _migrate_legacy_facts(self, user_id: str, user: dict):
+        """Move facts from the old unbounded array in the user document to the fact store"""
+        legacy = (user or {}).get("facts")
+        if not legacy: return
+        try:
+            for fact in legacy:
+                await self.facts.add(user_id, fact)
+            await self.users.update_one({"user_id": user_id}, {"$unset": {"facts": ""}})
+        except Exception as e:
+            print(f"Error migrating user facts: {e}")
 
     async def update_user_interaction(self, user_id: str, username: str, roles: list[str]):
-        """Update user info and last seen timestamp"""
+        """Buffer user info and last seen timestamp, written later by the flusher"""
         if self.users is None: return
-        
+
+        self._pending[str(user_id)] = (username, roles, time.time())
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.get_running_loop().create_task(self._flush_loop())
+        if len(self._pending) >= self._flush_size:
+            self._flush_requested.set()
+
+    async def _flush_loop(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), self._flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Write every buffered interaction with a single bulk_write"""
+        if self.users is None or not self._pending: return
+
+        pending, self._pending = self._pending, {}
+        ops = [
+            UpdateOne({"user_id": user_id}, self._interaction_update(username, roles, last_seen), upsert=True)
+            for user_id, (username, roles, last_seen) in pending.items()
+        ]
         try:
-            await self.users.update_one(
-                {"user_id": str(user_id)},
-                {
-                    "$set": {
-                        "username": username,
-                        "roles": roles,
-                        "last_seen": time.time()
-                    },
-                    "$setOnInsert": {
-                        "facts": [],
-                        "conversation_summary": "",
-                        "created_at": time.time()
-                    }
-                },
-                upsert=True
+            await self.users.bulk_write(ops, ordered=False)
+        except Exception as e:
+            print(f"Error flushing user interactions: {e}")
+            # Keep the failed state for the next flush unless the user was seen again meanwhile
+            for user_id, state in pending.items():
+                self._pending.setdefault(user_id, state)
+
+    async def close(self):
+        """Stop the flusher and write whatever is still buffered"""
+        if self._flusher is not None:
+            # Wake the flusher and let it finish rather than cancel it: a cancelled
+            # bulk_write would drop the batch it had already taken from the buffer
+            self._closing = True
+            self._flush_requested.set()
+            await self._flusher
+            self._flusher = None
+            self._closing = False
+        await self.flush()
+
+    async def touch_and_get(self, user_id: str, username: str, roles: list[str]) -> dict:
+        """
+        Record an interaction and return the user's memory.
+
+        A cache miss costs one find_one_and_update round-trip; a cached user
+        costs none, its interaction goes to the write-behind buffer.
+        """
+        user_id = str(user_id)
+        memory = self._cache.get(user_id)
+        if memory is not None:
+            memory["roles"] = roles
+            await self.update_user_interaction(user_id, username, roles)
+            return memory
+
+        if self.users is None: return self._to_memory(None)
+
+        # This write supersedes anything still buffered for the user
+        self._pending.pop(user_id, None)
+        try:
+            user = await self.users.find_one_and_update(
+                {"user_id": user_id},
+                self._interaction_update(username, roles),
+                projection=MEMORY_PROJECTION,
+                upsert=True,
+                return_document=ReturnDocument.AFTER
             )
         except Exception as e:
             print(f"Error updating user memory: {e}")
+            return self._to_memory(None)
+
+        await self._migrate_legacy_facts(user_id, user)
+        memory = self._to_memory(user)
+        self._cache.set(user_id, memory)
+        return memory
 
     async def get_memory(self, user_id: str) -> dict:
-        """Get user memory facts and context"""
-        if self.users is None: return {"facts": [], "roles": []}
+        """Get user roles and conversation summary"""
+        user_id = str(user_id)
+        memory = self._cache.get(user_id)
+        if memory is not None:
+            return memory
+
+        if self.users is None: return self._to_memory(None)
         
-        user = await self.users.find_one({"user_id": str(user_id)})
+        user = await self.users.find_one({"user_id": user_id}, MEMORY_PROJECTION)
         if not user:
-            return {"facts": [], "roles": []}
+            return self._to_memory(None)
             
-        return {
-            "facts": user.get("facts", []),
-            "roles": user.get("roles", []),
-            "summary": user.get("conversation_summary", "")
-        }
+        await self._migrate_legacy_facts(user_id, user)
+        memory = self._to_memory(user)
+        self._cache.set(user_id, memory)
+        return memory
 
-    async def add_memory_fact(self, user_id: str, fact: str):
-        """Add a specific fact to user memory"""
+    async def set_summary(self, user_id: str, summary: str):
+        """Replace the user's conversation summary"""
         if self.users is None: return
-        await self.users.update_one(
-            {"user_id": str(user_id)},
-            {"$push": {"facts": fact}}
-        )
\ No newline at end of file
+        user_id = str(user_id)
+        await self.users.update_one({"user_id": user_id}, {"$set": {"conversation_summary": summary}})
+
+        memory = self._cache.get(user_id)
+        if memory is not None:
+            memory["summary"] = summary
+
+    async def get_relevant_facts(self, user_id: str, query: str) -> list[str]:
+        """Facts about the user most relevant to `query`, within the prompt token budget"""
+        if self.facts is None: return []
+        try:
+            return await self.facts.relevant(str(user_id), query)
+        except Exception as e:
+            print(f"Error fetching user facts: {e}")
+            return []
+
+    async def add_memory_fact(self, user_id: str, fact: str):
+        """Add a specific fact to user memory (near-duplicates are ignored)"""
+        if self.facts is None: return
+        await self.facts.add(str(user_id), fact)
@@ -0,0 +1,84 @@
+from concurrent.futures import ThreadPoolExecutor
+from ..config import config
+from .ai_service import TIMEOUT_RESPONSE
+import asyncio
+import base64
+
+
+class OffloadService:
+    """
+    Runs generations on the Celery workers and waits for their results without blocking the loop.
+
+    Results are polled rather than waited on in a thread, so a pending generation
+    holds no thread; the broker and backend calls themselves go to a small pool
+    of our own instead of the default executor used by file I/O. A wait that is
+    cancelled (e.g. the message was deleted) or times out revokes the task.
+    """
+
+    def __init__(self, timeout: float = None, poll_interval: float = None):
+        # Celery is only needed (and installed, with the "workers" extra) in offload mode
+        from . import offload_tasks
+        self._tasks = offload_tasks
+        self.timeout = timeout or config.OFFLOAD_TIMEOUT
+        self.poll_interval = poll_interval or config.OFFLOAD_POLL_INTERVAL
+        self._executor = ThreadPoolExecutor(max_workers=config.OFFLOAD_THREADS, thread_name_prefix="offload")
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "revoked": 0}
+
+    async def _run(self, fn, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, lambda: fn(*args, **kwargs))
+
+    async def _call(self, task, **kwargs) -> dict:
+        self.stats["submitted"] += 1
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        result = None
+        finished = False
+        try:
+            # In eager mode apply_async runs the task right here, hence the executor
+            result = await self._run(task.apply_async, kwargs=kwargs)
+            while not await self._run(result.ready):
+                if loop.time() >= deadline:
+                    raise asyncio.TimeoutError(f"{task.name} took longer than {self.timeout}s")
+                await asyncio.sleep(self.poll_interval)
+            finished = True
+            # The bot is never itself a task, so fetching the result can't deadlock a worker
+            value = await self._run(result.get, disable_sync_subtasks=False)
+        except BaseException:
+            self.stats["failed"] += 1
+            if result is not None and not finished:
+                # Nobody is waiting for it any more; don't let a worker pay for the generation
+                self.stats["revoked"] += 1
+                self._executor.submit(result.revoke)
+            raise
+        self.stats["completed"] += 1
+        return value
+
+    async def generate_response(self, message: str, conversation_history: list = None, user_context: str = None,
+                                system_instruction: str = None) -> tuple[str, list[str]]:
+        """Same contract as AIService.generate_response: failures come back as its stand-in texts"""
+        try:
+            result = await self._call(
+                self._tasks.generate_ai_response,
+                message=message,
+                conversation_history=conversation_history,
+                user_context=user_context,
+                system_instruction=system_instruction
+            )
+        except asyncio.TimeoutError:
+            return TIMEOUT_RESPONSE, []
+        except Exception as e:
+            return f"Error generating response: {str(e)}", []
+        return result["text"], result["memories"]
+
+    async def fetch_image(self, prompt: str, model: str = None, width: int = 1024, height: int = 1024,
+                          seed: int = None, enhance: bool = False) -> tuple[bytes, str]:
+        """Same contract as ImageService.fetch_image"""
+        result = await self._call(
+            self._tasks.generate_image,
+            prompt=prompt, model=model, width=width, height=height, seed=seed, enhance=enhance
+        )
+        return base64.b64decode(result["image"]), result["key"]
+
+
+# None unless WORKER_OFFLOAD is on; callers fall back to running generations in-process
+offload_service = OffloadService() if config.WORKER_OFFLOAD else None
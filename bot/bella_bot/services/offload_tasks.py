@@ -0,0 +1,59 @@
+from celery import Celery
+from ..config import config
+import asyncio
+import base64
+import threading
+
+# Shared by the bot (which enqueues) and the workers in /workers (which run the tasks),
+# so both sides agree on task names and payloads. With the "memory://" broker tasks run
+# eagerly in the calling process, which is handy for trying offload mode locally.
+celery_app = Celery("bella_worker", broker=config.CELERY_BROKER_URL, backend=config.CELERY_RESULT_BACKEND)
+celery_app.conf.update(
+    task_serializer="json",
+    result_serializer="json",
+    accept_content=["json"],
+    result_expires=600,
+    # Generations are long; hand each worker process one at a time and requeue on crash
+    worker_prefetch_multiplier=1,
+    task_acks_late=True,
+    task_time_limit=config.OFFLOAD_TIMEOUT,
+)
+if config.CELERY_BROKER_URL == "memory://":
+    celery_app.conf.update(task_always_eager=True, task_eager_propagates=True, result_backend="cache+memory://")
+
+# Each worker thread keeps one event loop and one set of services, so pooled
+# HTTP clients and semaphores stay bound to the loop they were created on
+_local = threading.local()
+
+
+def _services():
+    if not hasattr(_local, "loop"):
+        from .ai_service import AIService
+        from .image_service import ImageService
+        _local.loop = asyncio.new_event_loop()
+        _local.ai = AIService()
+        _local.image = ImageService(default_model=config.IMAGE_MODEL, auth_token=config.POLLINATIONS_TOKEN)
+    return _local
+
+
+@celery_app.task(name="generate_ai_response")
+def generate_ai_response(message: str, conversation_history: list = None, user_context: str = None,
+                         system_instruction: str = None) -> dict:
+    services = _services()
+    text, memories = services.loop.run_until_complete(services.ai.generate_response(
+        message,
+        conversation_history=conversation_history,
+        user_context=user_context,
+        system_instruction=system_instruction
+    ))
+    return {"text": text, "memories": memories}
+
+
+@celery_app.task(name="generate_image")
+def generate_image(prompt: str, model: str = None, width: int = 1024, height: int = 1024,
+                   seed: int = None, enhance: bool = False) -> dict:
+    services = _services()
+    data, key = services.loop.run_until_complete(
+        services.image.fetch_image(prompt, model, width, height, seed, enhance)
+    )
+    return {"key": key, "image": base64.b64encode(data).decode("ascii")}
@@ -0,0 +1,158 @@
+import asyncio
+import re
+from typing import AsyncIterator, Awaitable, Callable
+from ..config import config
+
+DISCORD_MESSAGE_LIMIT = 2000
+MEMORY_TAG = "[MEMORY:"
+# Matched on the original text: upper() can change a string's length ("ß" -> "SS")
+_MEMORY_TAG = re.compile(re.escape(MEMORY_TAG), re.IGNORECASE)
+EMPTY_RESPONSE = "I'm sorry, I couldn't generate a response."
+
+
+class MemoryTagFilter:
+    """Strips [MEMORY: ...] tags from streamed text as it arrives"""
+
+    def __init__(self):
+        self._buffer = ""
+        self.memories = []
+
+    def feed(self, text: str) -> str:
+        """Add a chunk and return the part of the text that is safe to display"""
+        self._buffer += text
+        visible = []
+        while True:
+            match = _MEMORY_TAG.search(self._buffer)
+            if match is None:
+                # Hold back a trailing "[MEM" that may become a tag with the next chunk
+                keep = self._partial_tag_length(self._buffer)
+                cut = len(self._buffer) - keep
+                visible.append(self._buffer[:cut])
+                self._buffer = self._buffer[cut:]
+                break
+
+            start = match.start()
+            visible.append(self._buffer[:start])
+            end = self._buffer.find("]", start)
+            if end == -1:
+                # Tag is still open, wait for the rest of it
+                self._buffer = self._buffer[start:]
+                break
+
+            fact = self._buffer[start + len(MEMORY_TAG):end].strip()
+            if fact:
+                self.memories.append(fact)
+            self._buffer = self._buffer[end + 1:]
+        return "".join(visible)
+
+    def flush(self) -> str:
+        """Return whatever is left once the stream has ended"""
+        rest, self._buffer = self._buffer, ""
+        if _MEMORY_TAG.match(rest):
+            # Unterminated tag, never show it
+            return ""
+        return rest
+
+    @staticmethod
+    def _partial_tag_length(text: str) -> int:
+        tail = text[-(len(MEMORY_TAG) - 1):]
+        for size in range(len(tail), 0, -1):
+            if MEMORY_TAG.startswith(tail[-size:].upper()):
+                return size
+        return 0
+
+
+class StreamedReply:
+    """
+    Posts a streamed response to Discord.
+
+    The first visible text is sent as soon as it arrives; the message is then
+    edited at most once per `edit_interval` seconds and rolls over to a new
+    message when it reaches Discord's 2000 character limit.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[str], Awaitable],
+        edit_interval: float = None,
+        limit: int = DISCORD_MESSAGE_LIMIT
+    ):
+        self._send = send
+        self.edit_interval = config.STREAM_EDIT_INTERVAL if edit_interval is None else edit_interval
+        self.limit = limit
+        self.messages = []
+        self._parts = []        # Finished text of previous messages
+        self._current = ""      # Text of the live message
+        self._shown = ""        # What the live message currently displays
+        self._last_edit = 0.0
+
+    @property
+    def text(self) -> str:
+        return "".join(self._parts) + self._current
+
+    async def run(self, chunks: AsyncIterator[str]) -> tuple[str, list[str]]:
+        """Consume the stream, returning the full visible text and extracted memories"""
+        tag_filter = MemoryTagFilter()
+        try:
+            async for chunk in chunks:
+                await self._append(tag_filter.feed(chunk))
+        finally:
+            # Close the upstream stream now if we stop early (e.g. cancelled), not at GC
+            aclose = getattr(chunks, "aclose", None)
+            if aclose is not None:
+                await aclose()
+        await self._append(tag_filter.flush())
+        await self._finish()
+        return self.text.strip() or EMPTY_RESPONSE, tag_filter.memories
+
+    async def _append(self, text: str):
+        if not text:
+            return
+
+        self._current += text
+        while len(self._current) > self.limit:
+            cut = self._split_point(self._current)
+            head, self._current = self._current[:cut], self._current[cut:]
+            await self._render(head, force=True)
+            self._parts.append(head)
+            self.messages.append(None)  # Placeholder, next render opens a new message
+            self._shown = ""
+
+        await self._render(self._current)
+
+    async def _finish(self):
+        if not self.text.strip():
+            await self._render(EMPTY_RESPONSE, force=True)
+            return
+        await self._render(self._current, force=True)
+
+    async def _render(self, content: str, force: bool = False):
+        content = content.strip()
+        if not content or content == self._shown:
+            return
+
+        loop = asyncio.get_running_loop()
+        live = self.messages[-1] if self.messages else None
+        if live is None:
+            # First visible tokens of this message go out immediately
+            message = await self._send(content)
+            if self.messages:
+                self.messages[-1] = message
+            else:
+                self.messages.append(message)
+        elif force or loop.time() - self._last_edit >= self.edit_interval:
+            await live.edit(content=content)
+        else:
+            return
+
+        self._shown = content
+        self._last_edit = loop.time()
+
+    def _split_point(self, text: str) -> int:
+        """Prefer breaking on a newline or space close to the limit"""
+        window = text[:self.limit]
+        for sep in ("\n", " "):
+            idx = window.rfind(sep)
+            if idx > self.limit // 2:
+                return idx + 1
+        return self.limit
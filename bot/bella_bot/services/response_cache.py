@@ -0,0 +1,100 @@
+from ..cache import TTLCache
+from ..config import config
+from ..text import fold
+from .fact_store import jaccard
+import re
+
+_WORD = re.compile(r"\w+")
+# Words that flip a question's meaning; "t" is what's left of "don't", "isn't", ...
+NEGATIONS = {
+    "no", "not", "t", "never", "nor", "none", "nothing", "nobody", "cannot", "without",
+    "لا", "لم", "لن", "ما", "ليس", "مش", "مو", "غير", "بدون",
+}
+
+
+def normalize(prompt: str) -> str:
+    """Case, Arabic spelling variants, punctuation and spacing don't change the key"""
+    return " ".join(_WORD.findall(fold(prompt)))
+
+
+def _bigrams(words: list[str]) -> set:
+    """Adjacent word pairs, padded so the first and last words count too; word order matters"""
+    padded = ["", *words, ""]
+    return set(zip(padded, padded[1:]))
+
+
+class ResponseCache:
+    """
+    Answers for context-free prompts, keyed by (persona, model, normalized prompt).
+
+    Entries expire after `ttl` seconds and the least recently used are evicted
+    past `maxsize`. With a `similarity` threshold (off by default), a prompt
+    whose word bigrams are at least that Jaccard-similar to a cached one (same
+    persona and model) is also a hit, unless the words that differ include a
+    negation or a short word, which can flip the meaning on their own ("is it
+    not allowed ..."). Candidates come from a small inverted index over cached words.
+    """
+
+    def __init__(self, maxsize: int = None, ttl: float = None, similarity: float = None):
+        self._entries = TTLCache(maxsize=maxsize or config.CHAT_CACHE_SIZE, ttl=ttl or config.CHAT_CACHE_TTL)
+        self.similarity = config.CHAT_CACHE_SIMILARITY if similarity is None else similarity
+        # (persona, model, word) -> normalized prompts containing it; pruned lazily as entries expire
+        self._index = {}
+        self.stats = {"hits": 0, "near_hits": 0, "misses": 0}
+
+    def get(self, persona: str, model: str, prompt: str) -> tuple[str | None, str]:
+        """Cached response (or None) and the kind of lookup result: "exact", "near" or "miss" """
+        key = normalize(prompt)
+        response = self._entries.get((persona, model, key))
+        if response is not None:
+            self.stats["hits"] += 1
+            return response, "exact"
+
+        if self.similarity and key:
+            response = self._nearest(persona, model, key.split())
+            if response is not None:
+                self.stats["near_hits"] += 1
+                return response, "near"
+
+        self.stats["misses"] += 1
+        return None, "miss"
+
+    def _nearest(self, persona: str, model: str, words: list[str]) -> str | None:
+        candidates = set()
+        for word in words:
+            candidates |= self._index.get((persona, model, word), set())
+
+        best, best_score = None, self.similarity
+        grams = _bigrams(words)
+        for candidate in candidates:
+            response = self._entries.get((persona, model, candidate))
+            if response is None:
+                self._unindex(persona, model, candidate)
+                continue
+            other = candidate.split()
+            if any(word in NEGATIONS or len(word) <= 3 for word in set(words) ^ set(other)):
+                continue
+            score = jaccard(grams, _bigrams(other))
+            if score >= best_score:
+                best, best_score = response, score
+        return best
+
+    def set(self, persona: str, model: str, prompt: str, response: str):
+        key = normalize(prompt)
+        if not key:
+            return
+        self._entries.set((persona, model, key), response)
+        if self.similarity:
+            for word in set(key.split()):
+                self._index.setdefault((persona, model, word), set()).add(key)
+
+    def _unindex(self, persona: str, model: str, key: str):
+        for word in set(key.split()):
+            postings = self._index.get((persona, model, word))
+            if postings is not None:
+                postings.discard(key)
+                if not postings:
+                    del self._index[(persona, model, word)]
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "entries": len(self._entries)}
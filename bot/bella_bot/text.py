@@ -0,0 +1,82 @@
+import re
+
+# Letter variants folded to one canonical form so spelling differences still match
+_ARABIC_VARIANTS = {
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",
+    "ى": "ي",
+    "ة": "ه",
+}
+# Harakat, superscript alef, Quranic marks and tatweel carry no meaning for matching
+_ARABIC_DROPPED = "ـً-ٰٟۖ-ۭ"
+
+_FOLD_TABLE = str.maketrans({
+    **_ARABIC_VARIANTS,
+    "ـ": None,
+    **{chr(c): None for c in range(0x064B, 0x0660)},
+    "ٰ": None,
+    **{chr(c): None for c in range(0x06D6, 0x06EE)},
+})
+_DROPPED_RE = re.compile(f"[{_ARABIC_DROPPED}]")
+# Anything fold changes besides case; most non-ASCII messages have none of it
+_FOLDED_RE = re.compile(f"[{''.join(_ARABIC_VARIANTS)}{_ARABIC_DROPPED}]")
+
+
+def _fold_variants(lowered: str) -> str:
+    # A handful of str.replace calls is much cheaper than str.translate on non-ASCII text
+    for variant, canonical in _ARABIC_VARIANTS.items():
+        if variant in lowered:
+            lowered = lowered.replace(variant, canonical)
+    return lowered
+
+
+def fold(text: str) -> str:
+    """Lowercase and normalize Arabic letter variants, diacritics and tatweel"""
+    if text.isascii():
+        return text.lower()
+    lowered = text.lower()
+    if not _FOLDED_RE.search(lowered):
+        return lowered
+    if not _DROPPED_RE.search(lowered):
+        return _fold_variants(lowered)
+    return lowered.translate(_FOLD_TABLE)
+
+
+def fold_with_offsets(text: str) -> tuple[str, list[int] | None]:
+    """
+    Fold text and keep a map back to the original string.
+
+    Returns the folded text and a list where entry i is the index in `text`
+    of folded character i (plus a trailing sentinel). The list is None when
+    folding kept every character in place, which is the common case.
+    """
+    lowered = text.lower()
+    if text.isascii():
+        return lowered, None
+    if len(lowered) == len(text):
+        if not _FOLDED_RE.search(lowered):
+            return lowered, None
+        if not _DROPPED_RE.search(lowered):
+            # Only variant letters left to fold, which keeps every index in place
+            return _fold_variants(lowered), None
+
+    folded = []
+    offsets = []
+    for i, ch in enumerate(text):
+        out = ch.lower().translate(_FOLD_TABLE)
+        folded.append(out)
+        offsets.extend([i] * len(out))
+    offsets.append(len(text))
+    return "".join(folded), offsets
+
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list[str]:
+    """Folded words of two or more characters, for similarity and ranking"""
+    return [word for word in _WORD_RE.findall(fold(text)) if len(word) > 1]
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough Gemini token count (about four characters per token)"""
+    return max(1, len(text) // 4)
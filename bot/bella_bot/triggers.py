@@ -0,0 +1,142 @@
+import re
+from typing import Iterable, NamedTuple
+from .text import fold, fold_with_offsets
+
+# Attached Arabic proclitics ("and", "the", vocative "ya") that may precede a keyword
+ARABIC_PREFIXES = ("وال", "فال", "ال", "يا", "و", "ف")
+# Attached suffixes, mostly the feminine imperative used when talking to Bella ("ارسمي", "ارسميلي")
+ARABIC_SUFFIXES = ("يلي", "يها", "ين", "لي", "ها", "ي")
+# Left behind at the edges of a prompt once "Bella, draw ..." is removed
+_EDGE_PUNCTUATION = " ,.:;!?-،؛؟"
+
+_MENTION = r"<@!?\d+>"
+
+
+class TriggerMatch(NamedTuple):
+    names: list[str]                # Bella names found, as configured
+    triggers: list[str]             # Image trigger words found, as configured
+    spans: list[tuple[int, int]]    # Spans in the original text of every keyword and user mention
+
+
+NO_MATCH = TriggerMatch([], [], [])
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
+
+
+class TriggerMatcher:
+    """
+    Finds Bella's names, image triggers and user mentions in a single pass.
+
+    Keywords are compiled into one trie-shaped regex over folded text (see
+    `text.fold`). Every branch of the pattern starts with a literal character,
+    which lets the regex engine skip straight to candidate positions; the
+    leading word boundary and Arabic proclitics are checked on the few hits.
+    """
+
+    def __init__(self, names: Iterable[str], triggers: Iterable[str]):
+        self._kinds = {}
+        for kind, words in (("name", names), ("trigger", triggers)):
+            for word in words:
+                self._kinds.setdefault(self._key(word), (kind, word))
+
+        suffixes = "|".join(ARABIC_SUFFIXES)
+        self._pattern = self._compile(self._kinds, rf"(?:{suffixes})?")
+        # Arabic keywords and suffixes can't occur in ASCII text, which is most traffic
+        self._ascii_pattern = self._compile([key for key in self._kinds if key.isascii()])
+
+    @classmethod
+    def _compile(cls, keys: Iterable[str], suffix: str = "") -> re.Pattern:
+        branches = "|".join([_MENTION, *cls._trie_branches(keys)])
+        return re.compile(rf"({branches}){suffix}(?!\w)")
+
+    @staticmethod
+    def _key(word: str) -> str:
+        return " ".join(fold(word).split())
+
+    @staticmethod
+    def _trie_branches(keys: Iterable[str]) -> list[str]:
+        """Build alternation branches that share common prefixes, e.g. bel(?:a|la)"""
+        trie = {}
+        for key in keys:
+            node = trie
+            for ch in key:
+                node = node.setdefault(ch, {})
+            node[""] = {}
+
+        def branches(node: dict) -> list[str]:
+            return [
+                (r"\s+" if ch == " " else re.escape(ch)) + emit(child)
+                for ch, child in sorted(node.items()) if ch
+            ]
+
+        def emit(node: dict) -> str:
+            children = branches(node)
+            if not children:
+                return ""
+            body = children[0] if len(children) == 1 else f"(?:{'|'.join(children)})"
+            # Greedy optional tail, so "create image" wins over "create"
+            return f"(?:{body})?" if "" in node else body
+
+        return branches(trie)
+
+    @staticmethod
+    def _word_start(folded: str, start: int) -> int:
+        """Return where the word containing a keyword at `start` begins, or -1 if it is not a word start"""
+        if start == 0 or not _is_word_char(folded[start - 1]):
+            return start
+        for prefix in ARABIC_PREFIXES:
+            begin = start - len(prefix)
+            if begin >= 0 and folded.startswith(prefix, begin) and (begin == 0 or not _is_word_char(folded[begin - 1])):
+                return begin
+        return -1
+
+    def match(self, text: str) -> TriggerMatch:
+        if text.isascii():
+            folded, offsets, pattern = text.lower(), None, self._ascii_pattern
+        else:
+            folded, offsets = fold_with_offsets(text)
+            pattern = self._pattern
+        # Plain search calls: most messages have no hit, and then this costs a single scan
+        m = pattern.search(folded)
+        if m is None:
+            return NO_MATCH
+
+        names = []
+        triggers = []
+        spans = []
+        while m is not None:
+            keyword = m.group(1)
+            end = m.end()
+            if keyword[0] == "<":
+                start = m.start()
+            else:
+                start = self._word_start(folded, m.start())
+                if start == -1:
+                    m = pattern.search(folded, end)
+                    continue
+                # Matched text is already folded; only multi-word keywords may need their spacing normalized
+                kind, original = self._kinds.get(keyword) or self._kinds[self._key(keyword)]
+                bucket = names if kind == "name" else triggers
+                if original not in bucket:
+                    bucket.append(original)
+
+            if offsets is not None:
+                spans.append((offsets[start], offsets[end]))
+            else:
+                spans.append((start, end))
+            m = pattern.search(folded, end)
+
+        return TriggerMatch(names, triggers, spans)
+
+    @staticmethod
+    def strip(text: str, match: TriggerMatch) -> str:
+        """Remove every matched span from `text` and collapse the leftover whitespace"""
+        pieces = []
+        last = 0
+        for start, end in match.spans:
+            pieces.append(text[last:start])
+            last = end
+        pieces.append(text[last:])
+        return " ".join("".join(pieces).split()).strip(_EDGE_PUNCTUATION)
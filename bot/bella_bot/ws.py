@@ -1,17 +1,175 @@
 import asyncio
+import json
 from fastapi import WebSocket
+from .config import config
+
+try:
+    import msgpack
+except ImportError:  # Optional: only needed for clients asking for binary frames
+    msgpack = None
+
+ENCODINGS = ("json", "msgpack")
+
+
+class _Client:
+    """A connected dashboard with its own bounded send queue and subscription"""
+
+    def __init__(self, websocket: WebSocket, queue_size: int):
+        self.websocket = websocket
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.task = None
+        # None means "everything"
+        self.types = None
+        self.guilds = None
+        self.levels = None
+        self.encoding = "json"
+
+    def wants(self, event_type: str, guild: str, level: str) -> bool:
+        return (
+            (self.types is None or event_type in self.types)
+            and (self.guilds is None or guild in self.guilds)
+            and (self.levels is None or level in self.levels)
+        )
+
+
+def _topic_set(values) -> set | None:
+    if not values:
+        return None
+    return {str(value) for value in values}
+
 
 class WebSocketManager:
-    def __init__(self):
-        self.active_connections = []
+    """
+    Fans events out to dashboard WebSockets.
+
+    broadcast() never waits on a socket: each client has a bounded queue
+    drained by its own task. A full queue drops its oldest event, and a
+    client that times out on a send, or drops `max_drops` events without
+    catching up in between, is evicted.
+
+    Clients receive every event until they send a subscription:
+        {"op": "subscribe", "types": [...], "guilds": [...], "levels": [...], "encoding": "json" | "msgpack"}
+    Omitted or empty lists match everything; {"op": "unsubscribe"} resets it.
+    "msgpack" switches the client to binary frames. Per-message deflate is
+    negotiated by the server during the handshake for clients that offer it.
+    """
+
+    def __init__(self, queue_size: int = None, send_timeout: float = None, max_drops: int = None):
+        self.queue_size = queue_size or config.WS_QUEUE_SIZE
+        self.send_timeout = send_timeout or config.WS_SEND_TIMEOUT
+        self.max_drops = max_drops or config.WS_MAX_DROPS
+        self.active_connections = {}  # WebSocket -> _Client
+        self.evicted = 0
 
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        client = _Client(websocket, self.queue_size)
+        client.task = asyncio.get_running_loop().create_task(self._send_loop(client))
+        self.active_connections[websocket] = client
 
     def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+        client = self.active_connections.pop(websocket, None)
+        if client is not None and client.task is not asyncio.current_task():
+            client.task.cancel()
+
+    async def broadcast(self, message):
+        """Queue an event (a dict, or its JSON text) for every client subscribed to it"""
+        event = json.loads(message) if isinstance(message, str) else message
+        payload = event.get("payload")
+        payload = payload if isinstance(payload, dict) else {}
+        event_type = event.get("type")
+        guild = event.get("guild") or payload.get("guild")
+        guild = str(guild) if guild is not None else None
+        level = event.get("level") or payload.get("level") or "INFO"
+
+        # Each encoding is produced at most once per event, shared by all clients using it
+        frames = {}
+        if isinstance(message, str):
+            frames["json"] = message
+        for client in list(self.active_connections.values()):
+            if not client.wants(event_type, guild, level):
+                continue
+            frame = frames.get(client.encoding)
+            if frame is None:
+                frame = frames[client.encoding] = self._encode(event, client.encoding)
+            self._enqueue(client, frame)
+
+    @staticmethod
+    def _encode(event: dict, encoding: str):
+        if encoding == "msgpack":
+            return msgpack.packb(event, default=str)
+        return json.dumps(event)
+
+    def handle_message(self, websocket: WebSocket, text: str):
+        """Apply a subscription message sent by a client"""
+        client = self.active_connections.get(websocket)
+        if client is None:
+            return
+
+        try:
+            request = json.loads(text)
+            op = request.get("op")
+        except Exception:
+            return
+
+        if op == "unsubscribe":
+            client.types = client.guilds = client.levels = None
+        elif op == "subscribe":
+            encoding = request.get("encoding", client.encoding)
+            if encoding not in ENCODINGS or (encoding == "msgpack" and msgpack is None):
+                self._enqueue(client, self._encode({"op": "error", "detail": f"Unsupported encoding: {encoding}"}, client.encoding))
+                return
+            client.types = _topic_set(request.get("types"))
+            client.guilds = _topic_set(request.get("guilds"))
+            client.levels = _topic_set(request.get("levels"))
+            client.encoding = encoding
+        else:
+            return
+
+        self._enqueue(client, self._encode({
+            "op": "subscribed",
+            "types": sorted(client.types or []),
+            "guilds": sorted(client.guilds or []),
+            "levels": sorted(client.levels or []),
+            "encoding": client.encoding,
+        }, client.encoding))
+
+    def _enqueue(self, client: _Client, frame):
+        if client.queue.full():
+            # Drop-oldest: a lagging dashboard should see recent events, not stale ones
+            client.queue.get_nowait()
+            client.dropped += 1
+            if client.dropped > self.max_drops:
+                self._evict(client)
+                return
+        client.queue.put_nowait(frame)
+
+    async def _send_loop(self, client: _Client):
+        try:
+            while True:
+                frame = await client.queue.get()
+                send = client.websocket.send_bytes if isinstance(frame, bytes) else client.websocket.send_text
+                await asyncio.wait_for(send(frame), self.send_timeout)
+                if client.queue.empty():
+                    # Caught up: earlier bursts no longer count towards eviction
+                    client.dropped = 0
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Dead or stalled connection
+            self._evict(client)
+
+    def _evict(self, client: _Client):
+        if self.active_connections.get(client.websocket) is not client:
+            return
+        self.evicted += 1
+        self.disconnect(client.websocket)
+        asyncio.get_running_loop().create_task(self._close(client.websocket))
 
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            await connection.send_text(message)
\ No newline at end of file
+    @staticmethod
+    async def _close(websocket: WebSocket):
+        try:
+            await websocket.close()
+        except Exception:
+            pass
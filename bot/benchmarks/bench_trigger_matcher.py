@@ -0,0 +1,122 @@
+"""
+Micro-benchmark: on_message keyword detection, legacy scans vs TriggerMatcher.
+
+Run from the bot/ directory:
+    python -m benchmarks.bench_trigger_matcher
+"""
+import random
+import re
+import timeit
+
+from bella_bot.triggers import TriggerMatcher
+
+# Kept in sync with events/on_message.py (importing it would need discord.py)
+BELLA_NAMES = ['bella', 'bela', 'بيلا', 'بللا', 'بلا']
+IMAGE_TRIGGERS = [
+    "generate", "create", "make", "draw", "imagine", "gen",
+    "paint", "design", "سوي", "اصنع", "ارسم", "صمم", "اعمل", "صور",
+    "رسم", "تخيل",
+    "image", "picture", "art", "drawing", "photo", "pic", "صورة",
+    "رسمة", "فن", "تصميم", "صوره",
+    "create image", "اصنعي صورة"
+]
+
+# Most traffic never mentions Bella; a few messages ask for images
+CHATTER = [
+    "anyone up for ranked tonight?",
+    "lol that was insane",
+    "السلام عليكم شباب",
+    "who's hosting the movie night on friday",
+    "تمام الحمدلله وانت؟",
+    "I pushed the fix, can someone review the PR",
+    "<@123456789012345678> check your DMs",
+    "ههههههه والله صح",
+    "does the server have a rules channel or not",
+    "good morning everyone ☀️",
+]
+BELLA_CHAT = [
+    "bella what's the weather like today",
+    "بيلا كيف حالك اليوم",
+    "<@987654321098765432> تذكري اني احب القهوة",
+    "hey Bella, tell me a joke",
+]
+IMAGE_REQUESTS = [
+    "bella draw a cat wearing a space helmet",
+    "Bella, create image of a neon city at night, cinematic lighting",
+    "يا بيلا ارسمي قطة فضائية",
+    "بيلا اصنعي صورة لأسد في الصحراء",
+    "<@987654321098765432> generate a picture of a dragon over the mountains",
+]
+
+
+def build_corpus(size: int = 5000, seed: int = 7) -> list[str]:
+    rng = random.Random(seed)
+    pools = [(CHATTER, 0.85), (BELLA_CHAT, 0.10), (IMAGE_REQUESTS, 0.05)]
+    corpus = []
+    for _ in range(size):
+        roll = rng.random()
+        for pool, weight in pools:
+            if roll < weight:
+                corpus.append(rng.choice(pool))
+                break
+            roll -= weight
+        else:
+            corpus.append(rng.choice(CHATTER))
+    return corpus
+
+
+def legacy(message: str):
+    """The detection and prompt cleaning previously inlined in on_message"""
+    content = message.lower().strip()
+    # on_message rebuilt both keyword lists for every message
+    bella_names = list(BELLA_NAMES)
+    image_triggers = list(IMAGE_TRIGGERS)
+    if not any(name in content for name in bella_names):
+        return None
+    if not any(trigger in content for trigger in image_triggers):
+        return ""
+    prompt = re.sub(r"<@!?\d+>", "", message)
+    for word in bella_names + image_triggers:
+        if word in prompt.lower():
+            prompt = re.sub(re.escape(word), '', prompt, flags=re.IGNORECASE)
+    return prompt.strip()
+
+
+def compiled(matcher: TriggerMatcher, message: str):
+    match = matcher.match(message)
+    if not match.names:
+        return None
+    if not match.triggers:
+        return ""
+    return matcher.strip(message, match)
+
+
+def bench(fn, messages: list[str], runs: int = 5) -> float:
+    """Best-of-`runs` microseconds per message"""
+    best = min(timeit.repeat(lambda: [fn(m) for m in messages], number=1, repeat=runs))
+    return best / len(messages) * 1e6
+
+
+def main():
+    corpus = build_corpus()
+    matcher = TriggerMatcher(BELLA_NAMES, IMAGE_TRIGGERS)
+    match = lambda m: compiled(matcher, m)
+
+    sets = [
+        ("full corpus", corpus),
+        ("chatter", [m for m in corpus if m in CHATTER]),
+        ("bella chat", [m for m in corpus if m in BELLA_CHAT]),
+        ("image requests", [m for m in corpus if m in IMAGE_REQUESTS]),
+    ]
+    print(f"{'':16} {'msgs':>6} {'legacy us':>10} {'matcher us':>11} {'speedup':>8}")
+    for label, messages in sets:
+        old, new = bench(legacy, messages), bench(match, messages)
+        print(f"{label:16} {len(messages):6} {old:10.2f} {new:11.2f} {old / new:7.1f}x")
+
+    print("\nimage prompts:")
+    for message in IMAGE_REQUESTS:
+        print(f"  {message!r}\n    legacy  -> {legacy(message)!r}\n    matcher -> {match(message)!r}")
+
+
+if __name__ == "__main__":
+    main()
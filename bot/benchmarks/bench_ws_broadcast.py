@@ -0,0 +1,104 @@
+"""
+Benchmark: dashboard broadcast with 500 connected clients, a few of them stalled.
+
+Compares the old sequential fan-out (await send_text on each socket in turn)
+with WebSocketManager's per-client queues. Run from the bot/ directory:
+    python -m benchmarks.bench_ws_broadcast
+"""
+import asyncio
+import json
+import statistics
+import time
+
+from bella_bot.ws import WebSocketManager
+
+CLIENTS = 500
+STALLED = 5
+EVENTS = 200
+EVENT_INTERVAL = 0.005
+# A stalled tab still answers eventually, just slowly
+STALL_DELAY = 0.05
+
+
+class FakeWebSocket:
+    def __init__(self, stalled: bool):
+        self.stalled = stalled
+        self.latencies = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text: str):
+        if self.stalled:
+            await asyncio.sleep(STALL_DELAY)
+        else:
+            await asyncio.sleep(0)
+        self.latencies.append(time.perf_counter() - json.loads(text)["sent_at"])
+
+    async def close(self):
+        pass
+
+
+class SequentialManager:
+    """The previous WebSocketManager.broadcast"""
+
+    def __init__(self):
+        self.active_connections = []
+
+    async def connect(self, websocket):
+        await websocket.accept()
+        self.active_connections.append(websocket)
+
+    def disconnect(self, websocket):
+        self.active_connections.remove(websocket)
+
+    async def broadcast(self, message: str):
+        for connection in self.active_connections:
+            await connection.send_text(message)
+
+
+async def run(manager, stalled: int) -> dict:
+    sockets = [FakeWebSocket(stalled=i < stalled) for i in range(CLIENTS)]
+    for ws in sockets:
+        await manager.connect(ws)
+
+    call_times = []
+    for i in range(EVENTS):
+        event = {"type": "mention_reply", "payload": {"n": i}, "sent_at": time.perf_counter()}
+        start = time.perf_counter()
+        await manager.broadcast(json.dumps(event))
+        call_times.append(time.perf_counter() - start)
+        await asyncio.sleep(EVENT_INTERVAL)
+    await asyncio.sleep(0.2)
+    for ws in sockets:
+        manager.disconnect(ws)
+    await asyncio.sleep(0)
+
+    healthy = [lat for ws in sockets if not ws.stalled for lat in ws.latencies]
+    healthy.sort()
+    return {
+        "broadcast_p50_ms": statistics.median(call_times) * 1000,
+        "broadcast_max_ms": max(call_times) * 1000,
+        "delivery_p50_ms": healthy[len(healthy) // 2] * 1000,
+        "delivery_p99_ms": healthy[int(len(healthy) * 0.99)] * 1000,
+        "delivered": len(healthy),
+    }
+
+
+async def main():
+    print(f"{CLIENTS} clients, stalled ones take {STALL_DELAY * 1000:.0f} ms per send, {EVENTS} events")
+    for stalled in (0, STALLED):
+        for label, manager in (
+            ("sequential", SequentialManager()),
+            ("queued", WebSocketManager(queue_size=100, send_timeout=1.0, max_drops=50)),
+        ):
+            result = await run(manager, stalled)
+            print(
+                f"{label:11} {stalled} stalled  broadcast p50 {result['broadcast_p50_ms']:7.2f} ms  "
+                f"max {result['broadcast_max_ms']:7.2f} ms  |  healthy delivery p50 {result['delivery_p50_ms']:7.2f} ms  "
+                f"p99 {result['delivery_p99_ms']:7.2f} ms"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,6 +1,4 @@
-from ..worker import app
+# Defined in the bot package so the bot can enqueue it (or run it eagerly with the memory:// broker)
+from bella_bot.services.offload_tasks import generate_ai_response
 
-@app.task
-def generate_ai_response(message):
-    # TODO: Implement AI response generation
-    return f"AI response: {message}"
\ No newline at end of file
+__all__ = ["generate_ai_response"]
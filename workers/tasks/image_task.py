@@ -1,6 +1,4 @@
-from ..worker import app
+# Defined in the bot package so the bot can enqueue it (or run it eagerly with the memory:// broker)
+from bella_bot.services.offload_tasks import generate_image
 
-@app.task
-def generate_image(prompt):
-    # TODO: Implement image generation logic
-    return f"Generated image for: {prompt}"
\ No newline at end of file
+__all__ = ["generate_image"]
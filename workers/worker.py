@@ -1,17 +1,7 @@
-from celery import Celery
-import os
+from bella_bot.services.offload_tasks import celery_app as app
 
-app = Celery('bella_worker', broker=os.getenv('REDIS_URL', 'redis://localhost:6379/0'))
-
-@app.task
-def process_ai_task(message):
-    # TODO: Process AI task
-    return f"Processed: {message}"
-
-@app.task
-def process_image_task(prompt):
-    # TODO: Generate image
-    return "Image URL"
+# Importing the task modules registers them with this worker
+from tasks import ai_task, image_task  # noqa: F401
 
 if __name__ == '__main__':
-    app.start()
\ No newline at end of file
+    app.worker_main(["worker", "--loglevel=INFO"])